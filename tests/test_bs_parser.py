@@ -0,0 +1,158 @@
+"""
+Tests for BeautifulSoupParser against saved TNSTC pages in tests/fixtures.
+The expected values are what the original BeautifulSoup implementation of the
+parser returns for the same pages, so any change in behaviour shows up here.
+"""
+import asyncio
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+from lxml import html as lxml_html
+from lxml.html import HtmlElement
+
+from tnstc_api.parsers.bs_parser import (
+    BeautifulSoupParser, _HTML_PARSER, _XP_BUS_LIST, _XP_DETAIL_NODES, _ADULT_FARE_RE, _CHILD_FARE_RE,
+)
+
+# Each test runs its own event loop, and the trip-details cache warns when it sees a new one
+pytestmark = pytest.mark.filterwarnings("ignore:alru_cache detected event loop change")
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+EXPECTED_SERVICES = [
+    {'operator': 'SALEM', 'bus_type': 'AC 3X2', 'trip_code': '0005SALMADMM01L', 'route_code': '104N1',
+     'departure_time': '00:10', 'arrival_time': '06:20', 'duration': '6.17', 'price_in_rs': 200, 'seats_available': 43,
+     'via_route': ['KARUR', 'DINDIGUL'], 'total_kms': '208.00', 'child_fare': '100'},
+    {'operator': 'VILLUPURAM', 'bus_type': 'ULTRA DELUXE', 'trip_code': '2215DHACHEDD02A', 'route_code': '275H',
+     'departure_time': '22:15', 'arrival_time': '04:55', 'duration': '7.45', 'price_in_rs': 350, 'seats_available': 20,
+     'via_route': ['TIRUPATHUR', 'VELLORE'], 'total_kms': '308.00', 'child_fare': '175'},
+    {'operator': 'SETC', 'bus_type': 'AC SLEEPER', 'trip_code': '1800SETCHEAB01B', 'route_code': '300A',
+     'departure_time': '18:00', 'arrival_time': '23:30', 'duration': '5.30', 'price_in_rs': 520, 'seats_available': 12,
+     'via_route': None, 'total_kms': None, 'child_fare': 'NA'},
+    {'operator': '', 'bus_type': 'DELUXE', 'trip_code': 'N/A', 'route_code': 'N/A',
+     'departure_time': '06:30', 'arrival_time': '08:00', 'duration': '1.30', 'price_in_rs': 0, 'seats_available': 0,
+     'via_route': None, 'total_kms': None, 'child_fare': 'NA'},
+    {'operator': '3.15 Hrs', 'bus_type': 'SEATER', 'trip_code': 'N/A', 'route_code': 'N/A',
+     'departure_time': '09:10', 'arrival_time': '12:25', 'duration': '3.15', 'price_in_rs': 150, 'seats_available': 30,
+     'via_route': None, 'total_kms': None, 'child_fare': 'NA'},
+]
+
+EXPECTED_FALLBACK = [
+    {'operator': 'SALEM', 'departure_time': '00:05', 'arrival_time': '06:15', 'duration': '6.10',
+     'price_in_rs': 195, 'trip_code': '0005SALMADMM01L', 'route_code': '104N1'},
+    {'operator': 'TNSTC-VILLUPURAM', 'departure_time': '22:15', 'arrival_time': '04:50', 'duration': '7.45',
+     'price_in_rs': 340, 'trip_code': '2215DHACHEDD02A', 'route_code': '275H'},
+    {'operator': 'SETC', 'departure_time': '18:00', 'arrival_time': '23:30', 'duration': '5.30',
+     'price_in_rs': 520, 'trip_code': '1800SETCHEAB01B', 'route_code': '300A'},
+    # Present but empty elements give "", missing ones "N/A"; the price digits sit inside a child tag
+    {'operator': '', 'departure_time': '06:30', 'arrival_time': '08:00', 'duration': '1.30',
+     'price_in_rs': 0, 'trip_code': 'N/A', 'route_code': 'N/A'},
+    {'operator': 'SALEM', 'departure_time': '--:--', 'arrival_time': 'N/A', 'duration': 'N/A',
+     'price_in_rs': 0, 'trip_code': 'N/A', 'route_code': 'N/A'},
+    # One span is both the operator and the duration, one div both a time-info and the price
+    {'operator': '3.15 Hrs', 'departure_time': '09:10', 'arrival_time': '12:25', 'duration': '3.15',
+     'price_in_rs': 150, 'trip_code': 'N/A', 'route_code': 'N/A'},
+]
+
+def _read(name: str) -> str:
+    return (FIXTURES / name).read_text(encoding = 'utf-8')
+
+def _bus_divs() -> List[HtmlElement]:
+    return _XP_BUS_LIST(lxml_html.document_fromstring(_read('search_results.html'), parser = _HTML_PARSER))
+
+def _details(trip_code: str) -> Tuple[HtmlElement, List[HtmlElement], List[HtmlElement], List[HtmlElement]]:
+    """The details page root and its <tr>, <strong> and <div> nodes, bucketed the way the parser does."""
+    root = lxml_html.document_fromstring(_read(f'trip_details_{trip_code}.html'), parser = _HTML_PARSER)
+    buckets: Dict[str, List[HtmlElement]] = {'tr': [], 'strong': [], 'div': []}
+    for el in _XP_DETAIL_NODES(root):
+        buckets[el.tag].append(el)
+    return root, buckets['tr'], buckets['strong'], buckets['div']
+
+def _run_parse(html_content: Any, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Runs parse() against a mock TNSTC that serves the saved trip details pages. Returns the services and the trip codes requested."""
+    requested: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        trip_code = parse_qs(request.content.decode())['TripCode'][0]
+        requested.append(trip_code)
+        page = FIXTURES / f'trip_details_{trip_code}.html'
+        if not page.exists():
+            raise httpx.ConnectError("Connection refused", request = request)
+        return httpx.Response(200, text = page.read_text(encoding = 'utf-8'))
+
+    async def run() -> List[Dict[str, Any]]:
+        async with httpx.AsyncClient(transport = httpx.MockTransport(handler)) as client:
+            services = await BeautifulSoupParser().parse(client, html_content, limit)
+        return [service.model_dump() for service in services]
+
+    return asyncio.run(run()), sorted(requested)
+
+
+def test_parse_search_results():
+    services, requested = _run_parse(_read('search_results.html'))
+    assert services == EXPECTED_SERVICES
+    # The bus without an onclick is never requested; the refused one falls back to the main list
+    assert requested == ['0005SALMADMM01L', '0630DHAKRIKK01D', '2215DHACHEDD02A']
+
+def test_parse_bytes():
+    # Raw page bytes, as a saved response would be passed in, give the same services
+    services, _ = _run_parse((FIXTURES / 'search_results.html').read_bytes())
+    assert services == EXPECTED_SERVICES
+
+def test_parse_limit():
+    services, requested = _run_parse(_read('search_results.html'), limit = 2)
+    assert services == EXPECTED_SERVICES[:2]
+    assert requested == ['0005SALMADMM01L', '2215DHACHEDD02A']
+
+def test_parse_empty_page():
+    assert _run_parse("") == ([], [])
+
+def test_parse_details_from_bus_div():
+    parser = BeautifulSoupParser()
+    assert [parser._parse_details_from_bus_div(bus_div) for bus_div in _bus_divs()] == EXPECTED_FALLBACK
+
+def test_parse_seats_and_via_route():
+    parser = BeautifulSoupParser()
+    bus_divs = _bus_divs()
+    # Only a span whose whole text is one string counts, so '<b>8</b> Seats Available' gives 0
+    assert [parser._parse_seats(bus_div) for bus_div in bus_divs] == [43, 20, 12, 0, 0, 30]
+    assert [parser._parse_via_route(bus_div) for bus_div in bus_divs] == [['KARUR', 'DINDIGUL'], ['TIRUPATHUR', 'VELLORE'], None, None, None, None]
+
+def test_parse_key_value_table():
+    parser = BeautifulSoupParser()
+    # Only the first label and value cell of each row are paired, so the second pair in a row is skipped
+    root, _, _, _ = _details('0005SALMADMM01L')
+    assert parser._parse_key_value_table(root) == {
+        'Corporation': 'SALEM', 'Route No.': '104N1', 'Total Kms': '208.00', 'Journey Hours': '6:10',
+    }
+    # Cells are matched anywhere in the row, in any order, including a label in a nested table
+    root, _, _, _ = _details('2215DHACHEDD02A')
+    assert parser._parse_key_value_table(root) == {
+        'Corporation': 'VILLUPURAM', 'Route No.': '275H', 'Total Kms': '308.00', 'Journey Hours': '',
+    }
+
+def test_find_fare_value():
+    parser = BeautifulSoupParser()
+    _, _, strongs, divs = _details('0005SALMADMM01L')
+    assert parser._find_fare_value(strongs, divs, _ADULT_FARE_RE) == '200'
+    assert parser._find_fare_value(strongs, divs, _CHILD_FARE_RE) == '100'
+    # The child fare label here is a plain <div>, found only after no <strong> matches
+    _, _, strongs, divs = _details('2215DHACHEDD02A')
+    assert parser._find_fare_value(strongs, divs, _ADULT_FARE_RE) == '350'
+    assert parser._find_fare_value(strongs, divs, _CHILD_FARE_RE) == '175'
+
+def test_parse_stops_table():
+    parser = BeautifulSoupParser()
+    # The first and last rows with a <td> after the heading; the <th> and empty rows are skipped
+    _, rows, _, _ = _details('0005SALMADMM01L')
+    data: Dict[str, Any] = {}
+    parser._parse_stops_table(rows, data)
+    assert data == {'departure_time': '00:10', 'arrival_time': '06:20'}
+
+    _, rows, _, _ = _details('2215DHACHEDD02A')
+    data = {}
+    parser._parse_stops_table(rows, data)
+    assert data == {'departure_time': '22:15', 'arrival_time': '04:55'}
\ No newline at end of file
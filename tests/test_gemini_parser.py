@@ -0,0 +1,163 @@
+"""
+Tests for GeminiParser's batch call with the structured-output chains replaced by
+stubs, so the retry logic runs without an API key or network access.
+"""
+import asyncio
+from typing import Any, List, Optional, Tuple
+
+import httpx
+import pytest
+from google.genai.errors import ClientError
+from langchain_core.exceptions import OutputParserException
+from langchain_google_genai.chat_models import ChatGoogleGenerativeAIError
+from pydantic import ValidationError
+
+from tnstc_api.config import GEMINI_RATE_LIMIT_COOLDOWN
+from tnstc_api.parsers import gemini_parser
+from tnstc_api.parsers.gemini_parser import GeminiParser, _ServiceCountMismatch, _is_rate_limit_error
+from tnstc_api.parsers.response_cache import bus_cache_key
+from tnstc_api.schemas import BusServiceWithReasoningList
+
+BATCH = [
+    (0, '<div class="bus-list">bus 0</div>', '<table>details 0</table>'),
+    (1, '<div class="bus-list">bus 1</div>', '<table>details 1</table>'),
+]
+
+class _StubLLM:
+    """Stands in for a structured-output chain. Returns (or raises) the queued outcomes in order."""
+
+    def __init__(self, *outcomes: Any, events: Optional[List[Any]] = None):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.events = events if events is not None else []
+
+    async def ainvoke(self, messages: List[Any]) -> Any:
+        self.calls += 1
+        self.events.append('call')
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+def _result(*trip_codes: str) -> BusServiceWithReasoningList:
+    """A valid LLM response with one service per trip code."""
+    return BusServiceWithReasoningList(services = [
+        {'operator': 'SALEM', 'bus_type': 'AC 3X2', 'trip_code': trip_code, 'route_code': '104N1',
+         'departure_time': '00:10', 'arrival_time': '06:20', 'duration': '6.17', 'price_in_rs': 200,
+         'seats_available': 43}
+        for trip_code in trip_codes
+    ])
+
+def _schema_error(wrapper: type = OutputParserException) -> Exception:
+    """What the structured-output chain raises for output that does not fit the schema."""
+    try:
+        BusServiceWithReasoningList.model_validate({'services': [{'operator': 'SALEM'}]})
+    except ValidationError as e:
+        error = wrapper(f"Failed to parse BusServiceWithReasoningList: {e}")
+        error.__cause__ = e
+        return error
+    raise AssertionError("schema accepted an incomplete service")
+
+def _wrapped(error: Exception) -> Exception:
+    """The client error as LangChain re-raises it: a ChatGoogleGenerativeAIError caused by the original."""
+    try:
+        raise ChatGoogleGenerativeAIError(f"Error calling model 'gemini': {error}") from error
+    except ChatGoogleGenerativeAIError as e:
+        return e
+
+class _StatusError(Exception):
+    """An error that carries the HTTP status in .status_code, as some client libraries do."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+def _run(parser: GeminiParser, batch: List[Tuple[int, str, str]] = BATCH) -> List[Tuple[int, str]]:
+    services = asyncio.run(parser._parse_batch_with_langchain(batch))
+    return [(idx, service.trip_code) for idx, service in services]
+
+@pytest.fixture
+def parser(monkeypatch: pytest.MonkeyPatch) -> GeminiParser:
+    monkeypatch.setattr(gemini_parser, 'GEMINI_API_KEY', 'test-key')
+    # Retries back off for seconds; the stubs answer at once, so the waits are skipped
+    async def no_sleep(delay: float) -> None:
+        pass
+    monkeypatch.setattr(asyncio, 'sleep', no_sleep)
+    parser = GeminiParser()
+    parser.escalation_llm = None
+    return parser
+
+
+def test_batch_results_are_cached_per_bus(parser):
+    parser.structured_llm = _StubLLM(_result('A', 'B'))
+    assert _run(parser) == [(0, 'A'), (1, 'B')]
+    assert parser._response_cache.get(bus_cache_key(BATCH[1][1], BATCH[1][2])).trip_code == 'B'
+
+def test_count_mismatch_is_retried(parser):
+    parser.structured_llm = _StubLLM(_result('A'), _result('A', 'B'))
+    assert _run(parser) == [(0, 'A'), (1, 'B')]
+    assert parser.structured_llm.calls == 2
+
+def test_count_mismatch_is_never_returned(parser):
+    # Rows paired with the wrong bus are neither returned nor cached once the retries run out
+    parser.structured_llm = _StubLLM(*[_result('A')] * 5)
+    with pytest.raises(_ServiceCountMismatch):
+        _run(parser)
+    assert parser.structured_llm.calls == 5
+    assert parser._response_cache.get(bus_cache_key(BATCH[0][1], BATCH[0][2])) is None
+
+def test_count_mismatch_escalates(parser):
+    parser.structured_llm = _StubLLM(_result('A', 'B', 'C'))
+    parser.escalation_llm = _StubLLM(_result('A', 'B'))
+    assert _run(parser) == [(0, 'A'), (1, 'B')]
+    assert (parser.structured_llm.calls, parser.escalation_llm.calls) == (1, 1)
+
+def test_output_parser_error_escalates(parser):
+    parser.structured_llm = _StubLLM(_schema_error())
+    parser.escalation_llm = _StubLLM(_result('A', 'B'))
+    assert _run(parser) == [(0, 'A'), (1, 'B')]
+    assert (parser.structured_llm.calls, parser.escalation_llm.calls) == (1, 1)
+
+def test_wrapped_validation_error_escalates(parser):
+    parser.structured_llm = _StubLLM(_schema_error(RuntimeError))
+    parser.escalation_llm = _StubLLM(_result('A', 'B'))
+    assert _run(parser) == [(0, 'A'), (1, 'B')]
+    assert parser.escalation_llm.calls == 1
+
+def test_network_error_retries_on_primary_model(parser):
+    parser.structured_llm = _StubLLM(httpx.ConnectError("Connection refused"), _result('A', 'B'))
+    parser.escalation_llm = _StubLLM()
+    assert _run(parser) == [(0, 'A'), (1, 'B')]
+    assert (parser.structured_llm.calls, parser.escalation_llm.calls) == (2, 0)
+
+def test_rate_limit_detected_from_status_codes():
+    assert _is_rate_limit_error(_wrapped(ClientError(429, {'error': {'message': 'Resource exhausted'}})))
+    assert _is_rate_limit_error(_wrapped(_StatusError(429)))
+    response = httpx.Response(429, request = httpx.Request('POST', 'https://generativelanguage.googleapis.com'))
+    assert _is_rate_limit_error(httpx.HTTPStatusError("Too Many Requests", request = response.request, response = response))
+
+def test_other_errors_are_not_rate_limits():
+    # A 429 in the message (a fare, a trip code) is not a rate limit
+    assert not _is_rate_limit_error(_wrapped(ClientError(400, {'error': {'message': 'Fare 429 is invalid'}})))
+    assert not _is_rate_limit_error(_wrapped(_StatusError(503)))
+    assert not _is_rate_limit_error(_schema_error())
+
+def test_rate_limit_holds_back_later_batches(parser, monkeypatch):
+    # Sleeps return at once, so the loop clock stays inside the cooldown for the whole test
+    events: List[Any] = []
+    async def record_sleep(delay: float) -> None:
+        events.append(('sleep', round(delay)))
+    monkeypatch.setattr(asyncio, 'sleep', record_sleep)
+    rate_limited = _wrapped(ClientError(429, {'error': {'message': 'Resource exhausted'}}))
+    parser.structured_llm = _StubLLM(rate_limited, _result('A', 'B'), _result('C'), events = events)
+
+    async def run() -> List[List[Tuple[int, Any]]]:
+        first = await parser._parse_batch_with_langchain(BATCH)
+        second = await parser._parse_batch_with_langchain([(2, '<div>bus 2</div>', '<table>details 2</table>')])
+        return [first, second]
+
+    first, second = asyncio.run(run())
+    assert [idx for idx, _ in first + second] == [0, 1, 2]
+    cooldown = round(GEMINI_RATE_LIMIT_COOLDOWN)
+    # After the 429, neither the retry nor the next batch calls Gemini until the pause is waited out
+    assert events == ['call', ('sleep', 2), ('sleep', cooldown), 'call', ('sleep', cooldown), 'call']
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Tests for OllamaParser's batch calls with ollama.AsyncClient.chat replaced by a
+stub, so the retry and single-bus fallback logic runs without an Ollama server.
+"""
+import asyncio
+import json
+import re
+from collections import Counter
+from typing import Any, Callable, List, Tuple
+
+import httpx
+import ollama
+import pytest
+
+from tnstc_api.parsers.ollama_parser import OllamaParser, _ServiceCountMismatch
+from tnstc_api.parsers.response_cache import bus_cache_key
+
+BATCH = [(idx, f'<div class="bus-list">bus {idx}</div>', f'<table>details {idx}</table>') for idx in range(3)]
+
+BAD_JSON = '{"services": [{"operator": "SALEM", '
+
+class _StubChat:
+    """
+    Stands in for ollama.AsyncClient.chat. Each call is answered by respond(bus
+    indexes, constrained), and recorded as (bus indexes, constrained).
+    """
+
+    def __init__(self, respond: Callable[[Tuple[int, ...], bool], str]):
+        self.respond = respond
+        self.calls: List[Tuple[Tuple[int, ...], bool]] = []
+
+    async def __call__(self, model: str, messages: List[Any], format: Any, **kwargs: Any) -> Any:
+        idxs = tuple(int(idx) for idx in re.findall(r"=== BUS (\d+) ===", messages[-1]['content']))
+        constrained = format != 'json'
+        self.calls.append((idxs, constrained))
+        return {'message': {'content': self.respond(idxs, constrained)}}
+
+def _content(*idxs: int) -> str:
+    """A valid model reply with one service per bus index, each tagged with its own trip code."""
+    return json.dumps({'services': [
+        {'operator': 'SALEM', 'bus_type': 'AC 3X2', 'trip_code': f'TRIP{idx}', 'route_code': '104N1',
+         'departure_time': '00:10', 'arrival_time': '06:20', 'duration': '6.17', 'price_in_rs': 200,
+         'seats_available': 43}
+        for idx in idxs
+    ]})
+
+def _run(parser: OllamaParser, batch: List[Tuple[int, str, str]] = BATCH) -> List[Tuple[int, str]]:
+    services = asyncio.run(parser._wrapper_parse_batch(parser._llm_slots, batch))
+    return [(idx, service.trip_code) for idx, service in services]
+
+@pytest.fixture
+def stub_chat(monkeypatch: pytest.MonkeyPatch) -> Callable[[Callable[[Tuple[int, ...], bool], str]], _StubChat]:
+    # Retries back off for seconds; the stub answers at once, so the waits are skipped
+    async def no_sleep(delay: float) -> None:
+        pass
+    monkeypatch.setattr(asyncio, 'sleep', no_sleep)
+
+    def install(respond: Callable[[Tuple[int, ...], bool], str]) -> _StubChat:
+        chat = _StubChat(respond)
+        monkeypatch.setattr(ollama.AsyncClient, 'chat', chat)
+        return chat
+    return install
+
+
+def test_valid_batch_is_one_plain_call(stub_chat):
+    chat = stub_chat(lambda idxs, constrained: _content(*idxs))
+    parser = OllamaParser()
+    assert _run(parser) == [(0, 'TRIP0'), (1, 'TRIP1'), (2, 'TRIP2')]
+    assert chat.calls == [((0, 1, 2), False)]
+    assert parser._response_cache.get(bus_cache_key(BATCH[2][1], BATCH[2][2])).trip_code == 'TRIP2'
+
+def test_bad_json_retries_schema_constrained(stub_chat):
+    chat = stub_chat(lambda idxs, constrained: _content(*idxs) if constrained else BAD_JSON)
+    assert _run(OllamaParser()) == [(0, 'TRIP0'), (1, 'TRIP1'), (2, 'TRIP2')]
+    assert chat.calls == [((0, 1, 2), False), ((0, 1, 2), True)]
+
+def test_count_mismatch_is_never_returned(stub_chat):
+    chat = stub_chat(lambda idxs, constrained: _content(*idxs[:-1]))
+    parser = OllamaParser()
+    with pytest.raises(_ServiceCountMismatch):
+        asyncio.run(parser._parse_batch_with_ollama(BATCH))
+    # The miscount switches the remaining attempts to constrained decoding
+    assert chat.calls == [((0, 1, 2), False), ((0, 1, 2), True), ((0, 1, 2), True)]
+    assert parser._response_cache.get(bus_cache_key(BATCH[0][1], BATCH[0][2])) is None
+
+def test_failed_batch_falls_back_to_one_call_per_bus(stub_chat):
+    # The batch always drops a service, and on its own bus 1 returns bad JSON
+    def respond(idxs: Tuple[int, ...], constrained: bool) -> str:
+        if len(idxs) > 1:
+            return _content(*idxs[:-1])
+        return BAD_JSON if idxs == (1,) else _content(*idxs)
+    chat = stub_chat(respond)
+    assert _run(OllamaParser()) == [(0, 'TRIP0'), (2, 'TRIP2')]
+    # Three batch attempts, then exactly one schema-constrained call per bus, even for the one that failed
+    singles = [call for call in chat.calls if len(call[0]) == 1]
+    assert len(chat.calls) == 3 + len(BATCH)
+    assert sorted(singles) == [((0,), True), ((1,), True), ((2,), True)]
+    assert Counter(idx for idxs, _ in chat.calls for idx in idxs) == {0: 4, 1: 4, 2: 4}
+
+def test_network_error_is_not_split(stub_chat):
+    def respond(idxs: Tuple[int, ...], constrained: bool) -> str:
+        raise httpx.ConnectError("Connection refused")
+    chat = stub_chat(respond)
+    assert _run(OllamaParser()) == []
+    # Every attempt stays in plain JSON mode, and no single-bus calls follow
+    assert chat.calls == [((0, 1, 2), False)] * 3
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Tests for ResponseCache and bus_cache_key, with time.monotonic patched so expiry
+is checked without waiting.
+"""
+import pytest
+
+from tnstc_api.parsers import response_cache
+from tnstc_api.parsers.response_cache import ResponseCache, bus_cache_key
+from tnstc_api.schemas import BusService
+
+class _Clock:
+    """Stands in for time.monotonic; only moves when a test advances it."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def _service(trip_code: str) -> BusService:
+    return BusService(
+        operator = 'SALEM', bus_type = 'AC 3X2', trip_code = trip_code, route_code = '104N1',
+        departure_time = '00:10', arrival_time = '06:20', duration = '6.17', price_in_rs = 200, seats_available = 43,
+    )
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> _Clock:
+    clock = _Clock()
+    monkeypatch.setattr(response_cache.time, 'monotonic', clock)
+    return clock
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = ResponseCache(maxsize = 4, ttl = 60)
+    cache.store('a', _service('A'))
+    clock.now += 60
+    assert cache.get('a').trip_code == 'A'
+    clock.now += 1
+    assert cache.get('a') is None
+    # The expired entry is dropped on read rather than kept until eviction
+    assert 'a' not in cache._entries
+
+def test_store_again_renews_ttl(clock):
+    cache = ResponseCache(maxsize = 4, ttl = 60)
+    cache.store('a', _service('A'))
+    clock.now += 50
+    cache.store('a', _service('A2'))
+    clock.now += 50
+    assert cache.get('a').trip_code == 'A2'
+
+def test_oldest_entry_evicted_at_capacity(clock):
+    cache = ResponseCache(maxsize = 2, ttl = 60)
+    cache.store('a', _service('A'))
+    cache.store('b', _service('B'))
+    # Storing 'a' again makes it the newest, so 'b' is the one evicted
+    cache.store('a', _service('A'))
+    cache.store('c', _service('C'))
+    assert [cache.get(key) is not None for key in ('a', 'b', 'c')] == [True, False, True]
+
+def test_cache_key_is_stable():
+    # A fixed digest rather than hash(), so the key is the same in every process and run
+    key = bus_cache_key('<div>bus</div>', '<table>details</table>')
+    assert key == '11dcd5e5a32ab2013d9c38ac18b0b005'
+    # The separator keeps the boundary between the two fragments part of the key
+    assert key != bus_cache_key('<div>bus</div><table>', 'details</table>')
+    assert key != bus_cache_key('<div>bus</div>', '<table>details 2</table>')
\ No newline at end of file
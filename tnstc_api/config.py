@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from typing import Literal, Optional
+from typing import List, Literal, Optional
 
 load_dotenv()
 
@@ -9,21 +9,77 @@ APP_ENV: str = os.getenv("APP_ENV", "development")
 
 LOG_DIR: str = "logs"
 
+# Uvicorn settings for `python -m tnstc_api.main`. Workers are only used outside development.
+SERVER_HOST: str = os.getenv("SERVER_HOST", "localhost")
+SERVER_PORT: int = int(os.getenv("SERVER_PORT", "9000"))
+SERVER_WORKERS: int = int(os.getenv("SERVER_WORKERS", str(max(2, os.cpu_count() or 1))))
+
+# Comma-separated CORS origins used outside development. A lone "*" allows any origin.
+CORS_ALLOWED_ORIGINS: List[str] = [o.strip() for o in os.getenv("CORS_ALLOWED_ORIGINS", "*").split(",") if o.strip()]
+
 TNSTC_BASE_URL: str = os.getenv('TNSTC_BASE_URL', 'https://www.tnstc.in/OTRSOnline/jqreq.do?')
 TNSTC_DETAILS_URL: str = "https://www.tnstc.in/OTRSOnline/advanceNewBooking.do"
+TNSTC_SEARCH_URL: str = TNSTC_BASE_URL + "hiddenAction=SearchService"
+
+# Timeouts (seconds) for the shared TNSTC HTTP client. READ also covers slow search pages;
+# CONNECT is kept short so an unreachable host fails fast, POOL bounds the wait for a free connection.
+HTTP_READ_TIMEOUT: float = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_WRITE_TIMEOUT: float = float(os.getenv("HTTP_WRITE_TIMEOUT", "10"))
+HTTP_POOL_TIMEOUT: float = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+
+# Place name -> PlaceInfo mappings are effectively static, so cache them for a day
+PLACE_CACHE_SIZE: int = int(os.getenv("PLACE_CACHE_SIZE", "4096"))
+PLACE_CACHE_TTL: int = int(os.getenv("PLACE_CACHE_TTL", "86400"))
 
 ParserStrategy = Literal["beautifulsoup", "gemini", "ollama"]
 PARSER_STRATEGY: ParserStrategy = os.getenv("PARSER_STRATEGY", "beautifulsoup") # type: ignore
 
 GEMINI_API_KEY: Optional[str] = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-preview-09-2025")
+# Optional stronger model that a batch switches to after the primary model's output fails validation
+GEMINI_ESCALATION_MODEL: Optional[str] = os.getenv("GEMINI_ESCALATION_MODEL") or None
 GEMINI_API_URL: str = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
+# Upper bound on the minified HTML packed into one Gemini call; larger result pages are split into several batches
+GEMINI_BATCH_MAX_CHARS: int = int(os.getenv("GEMINI_BATCH_MAX_CHARS", "800000"))
+# Max simultaneous Gemini calls per worker process, shared by all searches
+GEMINI_CONCURRENCY_LIMIT: int = int(os.getenv("GEMINI_CONCURRENCY_LIMIT", "4"))
+# Seconds every batch waits after any batch is rate limited (HTTP 429) before calling Gemini again
+GEMINI_RATE_LIMIT_COOLDOWN: float = float(os.getenv("GEMINI_RATE_LIMIT_COOLDOWN", "20"))
+# Seconds a search waits for all of its Gemini batches; slower batches are dropped and the rest returned
+GEMINI_PARSE_TIMEOUT: float = float(os.getenv("GEMINI_PARSE_TIMEOUT", "120"))
+# Parsed results cached per bus, keyed on its HTML, so repeat searches only send changed buses to the LLM
+GEMINI_RESPONSE_CACHE_SIZE: int = int(os.getenv("GEMINI_RESPONSE_CACHE_SIZE", "256"))
+GEMINI_RESPONSE_CACHE_TTL: int = int(os.getenv("GEMINI_RESPONSE_CACHE_TTL", "600"))
 
 OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# A small 4-bit quant (e.g. "qwen2.5:3b-instruct-q4_K_M") is enough for schema-constrained JSON
+# extraction and leaves room in VRAM for more parallel slots than an FP16 model
 OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "llama3:8b")
 OLLAMA_API_URL: str = f"{OLLAMA_BASE_URL}/api/generate"
+# How long Ollama keeps the model (and the cached system-prompt prefix) loaded after a request
+OLLAMA_KEEP_ALIVE: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Buses sent to Ollama in one call, so the static system prompt is prefilled once per batch
+OLLAMA_BATCH_SIZE: int = int(os.getenv("OLLAMA_BATCH_SIZE", "4"))
+# Context window per parallel slot. Fixed rather than sized per request, since Ollama reloads
+# the model whenever num_ctx changes. Must fit the ~2.5K-token system prompt plus one batch's HTML and output.
+OLLAMA_NUM_CTX: int = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+# Output token cap per bus (a batch gets this times OLLAMA_BATCH_SIZE); one BusService JSON object is well under it
+OLLAMA_NUM_PREDICT: int = int(os.getenv("OLLAMA_NUM_PREDICT", "512"))
+# Parsed results cached per bus, keyed on its HTML, so repeat searches only send changed buses to the LLM
+OLLAMA_RESPONSE_CACHE_SIZE: int = int(os.getenv("OLLAMA_RESPONSE_CACHE_SIZE", "4096"))
+OLLAMA_RESPONSE_CACHE_TTL: int = int(os.getenv("OLLAMA_RESPONSE_CACHE_TTL", "600"))
 
+# Max simultaneous Ollama calls per worker process, shared by all searches. Set it to the
+# server's OLLAMA_NUM_PARALLEL so every slot the server can batch is kept busy, and no more.
 OLLAMA_CONCURRENCY_LIMIT: int = int(os.getenv("OLLAMA_CONCURRENCY_LIMIT", "5"))
 
+# Max simultaneous loadTripDetails calls per search, so large result pages don't hammer TNSTC
+TRIP_DETAILS_CONCURRENCY_LIMIT: int = int(os.getenv("TRIP_DETAILS_CONCURRENCY_LIMIT", "10"))
+
+# Trip-details pages rarely change within a day, so repeat searches reuse them for 10 minutes
+TRIP_DETAILS_CACHE_SIZE: int = int(os.getenv("TRIP_DETAILS_CACHE_SIZE", "2048"))
+TRIP_DETAILS_CACHE_TTL: int = int(os.getenv("TRIP_DETAILS_CACHE_TTL", "600"))
+
 OLLAMA_LOAD_TIMEOUT: int = int(os.getenv("OLLAMA_LOAD_TIMEOUT", "200"))
 GEMINI_LOAD_TIMEOUT: int = int(os.getenv("GEMINI_LOAD_TIMEOUT", "200"))
\ No newline at end of file
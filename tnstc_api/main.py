@@ -1,54 +1,110 @@
-from fastapi import FastAPI, status, Query
+from fastapi import FastAPI, HTTPException, status, Query, Depends, Request
 from .tnstc_client import get_place_info, parse_bus_results, filter_bus_services
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import uvicorn
 import httpx
-from fastapi import FastAPI, HTTPException
 from .schemas import SearchRequest, BusSearchResponse, ResponseMetadata
 import asyncio
-import logging
 from utils.logging_setup import setup_logging
-from .config import TNSTC_BASE_URL, PARSER_STRATEGY
-from typing import Optional
+from .config import (
+    TNSTC_SEARCH_URL, PARSER_STRATEGY, APP_ENV, SERVER_HOST, SERVER_PORT, SERVER_WORKERS, CORS_ALLOWED_ORIGINS,
+    HTTP_READ_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_WRITE_TIMEOUT, HTTP_POOL_TIMEOUT,
+)
+from typing import Optional, AsyncIterator, Dict
 from datetime import datetime
+from contextlib import asynccontextmanager
 
-setup_logging()
 log = logging.getLogger(__name__)
 
+# Search form fields that never change between requests. Built once at import
+# and merged into each request's payload.
+_STATIC_SEARCH_PAYLOAD = {
+    'hiddenAction': 'SearchService', 
+    
+    # Hardcoded fields
+    'languageType': 'E',
+    'checkSingleLady': 'N',
+
+    # Include other necessary but empty fields
+    'selectOnwardTimeSlab': '', 'hiddenTotalMales': '', 'txtAdultMales': '', 'txtChildMales': '',
+    'txtAdultFemales': '', 'txtChildFemales': '', 'hiddenTotalFemales': '', 'selectClass': '',
+    'hiddenOnwardTimeSlab': '', 'hiddenClassCategoryLookupID': '', 'chkTatkal': '',
+    'hiddenClassName': '', 'matchPStartPlace': '', 'matchPEndPlace': '', 'txtdeptDatePtrip': '',
+    'txtUserLoginID': '', 'txtPassword': '', 'txtCaptchaCode': '', 'txtRUserLoginID': '',
+    'txtRMobileNo': '', 'txtRUserFullName': '', 'txtRPassword': '',
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Creates one shared httpx.AsyncClient for the lifetime of the app so every
+    search reuses pooled keep-alive connections to tnstc.in instead of paying
+    a fresh TCP + TLS handshake per request. HTTP/2 lets the concurrent place
+    lookups and trip-detail calls multiplex over a single connection.
+
+    Logging is configured here, once per worker process, rather than as a
+    side effect of importing a module.
+    """
+    setup_logging()
+    app.state.http = httpx.AsyncClient(
+        http2 = True,
+        timeout = httpx.Timeout(
+            HTTP_READ_TIMEOUT,
+            connect = HTTP_CONNECT_TIMEOUT,
+            write = HTTP_WRITE_TIMEOUT,
+            pool = HTTP_POOL_TIMEOUT,
+        ),
+        limits = httpx.Limits(max_connections = 200, max_keepalive_connections = 100, keepalive_expiry = 30.0),
+    )
+    log.info("Shared HTTP client created.")
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+        log.info("Shared HTTP client closed.")
+
 # Initialize FastAPI App
 app = FastAPI(
     title = "TNSTC API Wrapper",
     description = "A FastAPI wrapper for the TNSTC booking website",
     version = "1.0.0",
+    lifespan = lifespan,
 )
 
-DEVELOPMENT_ORIGINS = [
-    "http://localhost:3000",
-    "http://127.0.0.1:3000",
-    "*"
-]
+# Any local frontend port in development, matched by one regex that Starlette compiles once.
+# Other environments use the explicit CORS_ALLOWED_ORIGINS list (or "*", which takes Starlette's allow-all path).
+DEVELOPMENT_ORIGIN_REGEX = r"^https?://(localhost|127\.0\.0\.1)(:\d+)?$"
+IS_DEVELOPMENT = APP_ENV == "development"
 
 app.add_middleware(
     CORSMiddleware,
     allow_credentials = True,
     allow_methods = ['GET', 'POST'],
     allow_headers = ['*'],
-    allow_origins = DEVELOPMENT_ORIGINS,
+    allow_origins = [] if IS_DEVELOPMENT else CORS_ALLOWED_ORIGINS,
+    allow_origin_regex = DEVELOPMENT_ORIGIN_REGEX if IS_DEVELOPMENT else None,
 )
 
+# Dependencies
+
+def get_http(request: Request) -> httpx.AsyncClient:
+    """Returns the app-scoped httpx.AsyncClient created in the lifespan."""
+    return request.app.state.http
+
 # Endpoints
 
 @app.get('/', tags = ['Health'])
-async def check_health():
-    logging.info('Health Check Endpoint was hit.')
+async def check_health() -> Dict[str, str]:
+    # Debug level: liveness probes hit this every few seconds
+    log.debug('Health Check Endpoint was hit.')
 
     return {
         "status" : "ok",
         "message" : "TNSTC API Wrapper is running."
     }
 
-@app.post("/search_buses", response_model=BusSearchResponse, status_code=status.HTTP_200_OK) 
+@app.post("/search_buses", response_model=BusSearchResponse, response_model_exclude_none=True, status_code=status.HTTP_200_OK) 
 async def search_buses(
     request: SearchRequest,
     limit: Optional[int] = Query(
@@ -56,8 +112,9 @@ async def search_buses(
         gt=0,
         title="Limit Parsed Results",
         description="Process and return only the first 'n' bus services found."
-    )
-):
+    ),
+    client: httpx.AsyncClient = Depends(get_http)
+) -> BusSearchResponse:
     """
     Performs the full, multi-step bus search against the external TNSTC API, and then filters the results.
     """
@@ -65,92 +122,93 @@ async def search_buses(
     search_time = datetime.now()
     log.info(f"Received search request: {request.from_place_name} -> {request.to_place_name} on {request.onward_date}")
 
-    async with httpx.AsyncClient(timeout=30.0) as client:        
-        try:
-            log.info("Starting concurrent place lookups.")
-            from_place_task = get_place_info(client, request.from_place_name, is_from_place=True)
-            to_place_task = get_place_info(client, request.to_place_name, is_from_place=False)
-            
-            from_place, to_place = await asyncio.gather(from_place_task, to_place_task)
-            
-        except HTTPException:
-            raise
-        except Exception as e:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-                                detail=f"Unexpected error during place identification: {e}")
-
-        payload = {
-            'hiddenStartPlaceID': from_place.id,
-            'hiddenEndPlaceID': to_place.id,
-            'txtStartPlaceCode': from_place.code,
-            'txtEndPlaceCode': to_place.code,
-            'hiddenStartPlaceName': from_place.name,
-            'hiddenEndPlaceName': to_place.name,
-            'matchStartPlace': from_place.name,
-            'matchEndPlace': to_place.name,
-            'selectStartPlace': from_place.code,
-            'selectEndPlace': to_place.code,
-            'txtJourneyDate': request.onward_date,
-            'txtReturnDate': request.return_date,
-            'hiddenOnwardJourneyDate': request.onward_date,
-            'hiddenReturnJourneyDate': request.return_date,
-            'hiddenAction': 'SearchService', 
-            
-            # Hardcoded fields
-            'languageType': 'E',
-            'checkSingleLady': 'N',
-
-            # Include other necessary but empty fields
-            'selectOnwardTimeSlab': '', 'hiddenTotalMales': '', 'txtAdultMales': '', 'txtChildMales': '',
-            'txtAdultFemales': '', 'txtChildFemales': '', 'hiddenTotalFemales': '', 'selectClass': '',
-            'hiddenOnwardTimeSlab': '', 'hiddenClassCategoryLookupID': '', 'chkTatkal': '',
-            'hiddenClassName': '', 'matchPStartPlace': '', 'matchPEndPlace': '', 'txtdeptDatePtrip': '',
-            'txtUserLoginID': '', 'txtPassword': '', 'txtCaptchaCode': '', 'txtRUserLoginID': '',
-            'txtRMobileNo': '', 'txtRUserFullName': '', 'txtRPassword': '',
-        }
+    try:
+        log.info("Starting concurrent place lookups.")
+        from_place_task = get_place_info(client, request.from_place_name, is_from_place=True)
+        to_place_task = get_place_info(client, request.to_place_name, is_from_place=False)
+        
+        from_place, to_place = await asyncio.gather(from_place_task, to_place_task)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
+                            detail=f"Unexpected error during place identification: {e}")
+
+    payload = {
+        'hiddenStartPlaceID': from_place.id,
+        'hiddenEndPlaceID': to_place.id,
+        'txtStartPlaceCode': from_place.code,
+        'txtEndPlaceCode': to_place.code,
+        'hiddenStartPlaceName': from_place.name,
+        'hiddenEndPlaceName': to_place.name,
+        'matchStartPlace': from_place.name,
+        'matchEndPlace': to_place.name,
+        'selectStartPlace': from_place.code,
+        'selectEndPlace': to_place.code,
+        'txtJourneyDate': request.onward_date,
+        'txtReturnDate': request.return_date,
+        'hiddenOnwardJourneyDate': request.onward_date,
+        'hiddenReturnJourneyDate': request.return_date,
+        **_STATIC_SEARCH_PAYLOAD,
+    }
+    
+    log.info(f"Executing external search API call. Payload data keys: {list(payload.keys())[:5]}...")
+
+    try:
+        response = await client.post(TNSTC_SEARCH_URL, data=payload)
+        response.raise_for_status()
+        log.info("External search API call successful. Starting HTML parsing.")
+
+        # response.text decodes with the charset from the Content-Type header (UTF-8 if none)
+        bus_list = await parse_bus_results(client, response.text, limit)
+        
+        total_found = len(bus_list)
+        log.info(f"Bus parsing complete. Parser found {total_found} services (before filtering).")
+        
+        filtered_bus_list = filter_bus_services(bus_list, request) 
+        
+        if not filtered_bus_list:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
+                                detail="No bus services found matching the specified route, date, and filters.")
+        
+        log.info(f"Filtering complete. {len(filtered_bus_list)} services remain after applying filters.")
+                    
+        # 1. Create the metadata object
+        metadata_obj = ResponseMetadata(
+            search_timestamp=search_time,
+            parser_strategy=PARSER_STRATEGY,
+            total_services_found_before_filtering=total_found,
+            limit_applied=limit
+        )
         
-        log.info(f"Executing external search API call. Payload data keys: {list(payload.keys())[:5]}...")
-
-        try:
-            final_url = TNSTC_BASE_URL + "hiddenAction=SearchService"
-            response = await client.post(final_url, data=payload)
-            response.raise_for_status()
-            log.info("External search API call successful. Starting HTML parsing.")
-
-            bus_list = await parse_bus_results(client, response.text, limit)
-            
-            total_found = len(bus_list)
-            log.info(f"Bus parsing complete. Parser found {total_found} services (before filtering).")
-            
-            filtered_bus_list = filter_bus_services(bus_list, request) 
-            
-            if not filtered_bus_list:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
-                                    detail="No bus services found matching the specified route, date, and filters.")
-            
-            log.info(f"Filtering complete. {len(filtered_bus_list)} services remain after applying filters.")
-                        
-            # 1. Create the metadata object
-            metadata_obj = ResponseMetadata(
-                search_timestamp=search_time,
-                parser_strategy=PARSER_STRATEGY,
-                total_services_found_before_filtering=total_found,
-                limit_applied=limit
-            )
-            
-            # 2. Construct and return the final response
-            return BusSearchResponse(
-                metadata=metadata_obj,
-                from_place=from_place,
-                to_place=to_place,
-                services=filtered_bus_list
-            )
-
-        except httpx.HTTPStatusError as e:
-             error_detail = f"External search API returned status {e.response.status_code}. The search may be temporarily unavailable."
-             raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=error_detail)
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"External API network request failed: {e}")
+        # 2. Construct and return the final response
+        return BusSearchResponse(
+            metadata=metadata_obj,
+            from_place=from_place,
+            to_place=to_place,
+            services=filtered_bus_list
+        )
+
+    except httpx.HTTPStatusError as e:
+         error_detail = f"External search API returned status {e.response.status_code}. The search may be temporarily unavailable."
+         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=error_detail)
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"External API network request failed: {e}")
 
 if __name__ == "__main__":
-    uvicorn.run("tnstc_api.main:app", host="localhost", port=9000, reload=False)
\ No newline at end of file
+    if APP_ENV == "development":
+        uvicorn.run("tnstc_api.main:app", host=SERVER_HOST, port=SERVER_PORT, reload=True)
+    else:
+        # "auto" picks uvloop and httptools when installed (uvicorn[standard]),
+        # and falls back to asyncio / h11 on platforms without them (Windows).
+        uvicorn.run(
+            "tnstc_api.main:app",
+            host=SERVER_HOST,
+            port=SERVER_PORT,
+            workers=SERVER_WORKERS,
+            loop="auto",
+            http="auto",
+            reload=False,
+            log_level="info",
+        )
\ No newline at end of file
@@ -1,14 +1,11 @@
 import logging
+from functools import lru_cache
 from ..config import PARSER_STRATEGY
 from .base import BusParser
 from .bs_parser import BeautifulSoupParser
-from .gemini_parser import GeminiParser
-from .ollama_parser import OllamaParser
 
 log = logging.getLogger(__name__)
 
-_parser_instance: BusParser = None # type: ignore
-
 def get_parser() -> BusParser:
     """
     Factory function to get the configured bus parser instance.
@@ -16,42 +13,37 @@ def get_parser() -> BusParser:
     Reads the PARSER_STRATEGY from config and returns the
     appropriate singleton parser instance.
     """
+    return _build_parser(PARSER_STRATEGY)
 
-    global _parser_instance
-    
-    if _parser_instance is not None:
-        current_strategy = PARSER_STRATEGY
-        if (isinstance(_parser_instance, GeminiParser) and current_strategy == "gemini") or \
-           (isinstance(_parser_instance, BeautifulSoupParser) and current_strategy == "beautifulsoup") or \
-           (isinstance(_parser_instance, OllamaParser) and current_strategy == "ollama"):
-            return _parser_instance
-        else:
-            log.info(f"Parser strategy changed. Re-initializing parser...")
-
-    _parser_instance = None # type: ignore
-
-    if PARSER_STRATEGY == "gemini":
+@lru_cache(maxsize=4)
+def _build_parser(strategy: str) -> BusParser:
+    """
+    Builds the parser for a strategy, once. The cache key is the strategy string,
+    so a fallback to BeautifulSoupParser is cached too instead of retried per call.
+    The LLM parsers are imported lazily so their SDKs only load when selected.
+    """
+    if strategy == "gemini":
         log.info("Initializing GeminiParser.")
         try:
-            _parser_instance = GeminiParser()
-        except ValueError as e:
+            from .gemini_parser import GeminiParser
+            return GeminiParser()
+        except (ValueError, ImportError) as e:
             log.error(f"Failed to initialize GeminiParser: {e}. Defaulting to 'beautifulsoup'.")
-            _parser_instance = BeautifulSoupParser()
+            return BeautifulSoupParser()
     
-    elif PARSER_STRATEGY == "ollama":
+    elif strategy == "ollama":
         log.info("Initializing OllamaParser.")
         try:
-            _parser_instance = OllamaParser()
+            from .ollama_parser import OllamaParser
+            return OllamaParser()
         except Exception as e:
             log.error(f"Failed to initialize OllamaParser: {e}. Defaulting to 'beautifulsoup'.")
-            _parser_instance = BeautifulSoupParser()
+            return BeautifulSoupParser()
 
-    elif PARSER_STRATEGY == "beautifulsoup":
+    elif strategy == "beautifulsoup":
         log.info("Initializing BeautifulSoupParser.")
-        _parser_instance = BeautifulSoupParser()
+        return BeautifulSoupParser()
         
     else:
-        log.error(f"Invalid PARSER_STRATEGY: '{PARSER_STRATEGY}'. Defaulting to 'beautifulsoup'.")
-        _parser_instance = BeautifulSoupParser()
-
-    return _parser_instance
\ No newline at end of file
+        log.error(f"Invalid PARSER_STRATEGY: '{strategy}'. Defaulting to 'beautifulsoup'.")
+        return BeautifulSoupParser()
\ No newline at end of file
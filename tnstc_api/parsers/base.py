@@ -1,5 +1,5 @@
 import httpx
-from typing import List, Protocol, Optional
+from typing import List, Protocol, Optional, Union
 from ..schemas import BusService
 
 class BusParser(Protocol):
@@ -14,7 +14,7 @@ class BusParser(Protocol):
     async def parse(
         self, 
         client: httpx.AsyncClient, 
-        html_content: str,
+        html_content: Union[str, bytes],
         limit: Optional[int] = None
     ) -> List[BusService]:
         """
@@ -22,8 +22,12 @@ class BusParser(Protocol):
 
         Args:
             client: An httpx.AsyncClient for making any necessary sub-requests
-                    (e.g., to get trip details).
-            html_content: The raw HTML string of the main search results page.
+                    (e.g., to get trip details). The app passes its shared
+                    HTTP/2 client from the lifespan, so the per-bus detail
+                    fetches multiplex over one pooled connection.
+            html_content: The raw HTML of the main search results page, either
+                          as a decoded string or as the undecoded response bytes,
+                          which are decoded from the charset the page declares.
             limit: If provided, stop parsing after this many buses
                    to prevent excess sub-requests.
 
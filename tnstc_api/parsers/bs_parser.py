@@ -1,214 +1,417 @@
 import httpx
-from typing import List, Optional, Dict, Any
-from bs4 import BeautifulSoup, Tag
-from ..schemas import BusService
+from typing import List, Optional, Dict, Any, Union, Tuple, Callable
+from lxml import etree, html as lxml_html
+from lxml.html import HtmlElement
+from pydantic import ValidationError
+from ..schemas import BusService, BUS_SERVICE_LIST_ADAPTER
 import re
 import asyncio
 import logging
-from ..config import TNSTC_DETAILS_URL
+from .trip_details import fetch_all_trip_details
 
 log = logging.getLogger(__name__)
 
+_ADULT_FARE_RE = re.compile(r"Adult\s*Fare", re.IGNORECASE)
+_CHILD_FARE_RE = re.compile(r"Child\s*Fare", re.IGNORECASE)
+
+# Fields _merge_row sets to "N/A" when the selectors cannot find them
+_PLACEHOLDER_FIELDS = ('operator', 'bus_type', 'trip_code', 'route_code', 'duration')
+
+# One preconfigured libxml2 HTML parser, reused for every page. Comments are
+# dropped at build time, the id index is skipped (nothing looks up by id), and
+# network access is disabled. Whitespace-only text nodes are kept, since the
+# text_content() of the seats, price and via-route cells relies on them to
+# separate tokens, and _single_string and _price_from_div only match
+# BeautifulSoup when they see the same strings it did. No encoding is forced:
+# the app passes decoded text, and raw bytes are decoded from the charset the
+# page itself declares (BOM or <meta>).
+_HTML_PARSER = lxml_html.HTMLParser(
+    remove_comments = True,
+    collect_ids = False,
+    no_network = True,
+)
+
+def _class_test(name: str) -> str:
+    """XPath predicate for a class token, so 'bus-list clearfix' still matches 'bus-list'."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# Precompiled XPath expressions for the main search results page.
+_XP_BUS_LIST = etree.XPath(f"//div[{_class_test('bus-list')}]")
+_XP_FIRST_N_BUS_LISTS = etree.XPath(f"(//div[{_class_test('bus-list')}])[position() <= $n]")
+# Each of these selects only the one node (or attribute) that is used, so no
+# candidate lists are built and scanned in Python.
+_XP_TRIP_ONCLICK = etree.XPath("(.//a[@data-target='#TripcodePopUp' and @onclick])[1]/@onclick")
+_XP_VIA_ROUTE = etree.XPath("(.//small[contains(@style, 'color: blue')])[1]/descendant::b[1]")
+# Seats come from the first of these spans whose single string (see _single_string)
+# mentions them, so a count split across child tags is skipped
+_XP_TEXT_1_SPANS = etree.XPath(f".//span[{_class_test('text-1')}]")
+
+# Precompiled XPath expressions for the trip details page.
+# Every node the trip-details helpers need, in document order, from one traversal.
+_XP_DETAIL_NODES = etree.XPath("//tr | //strong | //div")
+# Key/value table: only the rows holding both a label and a value cell (anywhere below
+# them, in any order) are selected, so the per-row cell lookups never run on other rows.
+_LABEL_CELL = f"td[{_class_test('bodytextWithSecondMainColor')}]"
+_VALUE_CELL = f"td[{_class_test('bodytextWithThirdMainColor')}]"
+_XP_KEY_VALUE_ROWS = etree.XPath(f"//tr[.//{_LABEL_CELL} and .//{_VALUE_CELL}]")
+_XP_LABEL_CELL = etree.XPath(f"(.//{_LABEL_CELL})[1]")
+_XP_VALUE_CELL = etree.XPath(f"(.//{_VALUE_CELL})[1]")
+_XP_FARE_BUTTON = etree.XPath(f"(.//span[{_class_test('button')}])[1]")
+
+_OPERATOR = f"(.//span[{_class_test('operator-name')}])[1]"
+_TIME_INFO = f".//div[{_class_test('time-info')}]"
+_DURATION = f"(.//span[{_class_test('duration')}])[1]"
+_PRICE = f"(.//div[{_class_test('price')}])[1]"
+# The codes span is matched on its whole class string, not on each token
+_CODES_CLASSES = ['text-1', 'text-muted', 'd-block']
+_CODES = f"(.//span[normalize-space(@class)='{' '.join(_CODES_CLASSES)}'][contains(., '/')])[1]"
+
+def _price_from_div(price_div: Optional[HtmlElement]) -> int:
+    """
+    Returns the first all-digit token of the price div, or 0. Child tags are
+    tokenized as their markup, so only digits set apart by whitespace count.
+    """
+    if price_div is None:
+        return 0
+    pieces = [price_div.text] if price_div.text else []
+    for child in price_div:
+        pieces.append(etree.tostring(child, encoding = str, method = 'html', with_tail = False))
+        if child.tail:
+            pieces.append(child.tail)
+    if not pieces:
+        return 0
+    amount = next((token for piece in pieces for token in piece.split() if token.isdigit()), None)
+    if amount is not None:
+        try:
+            return int(amount)
+        except ValueError:
+            pass
+    log.warning("BS_Parser: Could not find numeric price in fallback.")
+    return 0
+
+# Every node the fallback fields are read from, fetched from a bus div with one
+# traversal and returned in document order. Only the time-info divs can repeat.
+_XP_BUS_FIELDS = etree.XPath(f"{_OPERATOR} | {_TIME_INFO} | {_DURATION} | {_PRICE} | {_CODES}")
+
+def _text_of(el: Optional[HtmlElement]) -> str:
+    """XPath string() of an optional element: its text content, or '' if missing."""
+    return el.text_content() if el is not None else ""
+
+def _first_span_text(time_infos: List[HtmlElement], position: int) -> str:
+    """Joined, stripped text of the first span inside the nth time-info div, or 'N/A'."""
+    if len(time_infos) <= position:
+        return "N/A"
+    span = next(time_infos[position].iter('span'), None)
+    return "".join(t.strip() for t in span.itertext()) if span is not None else "N/A"
+
+def _duration_text(duration: Optional[HtmlElement]) -> str:
+    """Duration span text without the 'Hrs' suffix, or 'N/A' if the span is missing or empty."""
+    text = _text_of(duration)
+    return text.strip().replace('Hrs', '').strip() if text else "N/A"
+
+def _code_part(codes: Optional[HtmlElement], part: int) -> str:
+    """The trip code (0) or route code (2) around the codes span's '/', or 'N/A' without the span."""
+    return _text_of(codes).partition('/')[part].strip() if codes is not None else "N/A"
+
+# Fallback fields scraped from each bus div, as (field, post-processor). Every
+# post-processor reads from the nodes _XP_BUS_FIELDS collected in one traversal.
+# Only a missing element maps to "N/A"; one that is present but empty gives "".
+_EXTRACTORS: Tuple[Tuple[str, Callable[[Dict[str, Any]], Any]], ...] = (
+    ('operator', lambda nodes: _text_of(nodes['operator']).strip() if nodes['operator'] is not None else "N/A"),
+    ('departure_time', lambda nodes: _first_span_text(nodes['time_infos'], 0)),
+    ('arrival_time', lambda nodes: _first_span_text(nodes['time_infos'], 2)),
+    ('duration', lambda nodes: _duration_text(nodes['duration'])),
+    ('price_in_rs', lambda nodes: _price_from_div(nodes['price'])),
+    ('trip_code', lambda nodes: _code_part(nodes['codes'], 0)),
+    ('route_code', lambda nodes: _code_part(nodes['codes'], 2)),
+)
+
+def _collect_bus_fields(bus_div: HtmlElement) -> Dict[str, Any]:
+    """
+    Buckets the _XP_BUS_FIELDS nodes of a bus div by the field they belong to. Each
+    node is tested for every field, since one element can carry the classes of two
+    (e.g. 'price time-info'). Document order makes the first match of a field the
+    node its own XPath selected.
+    """
+    nodes: Dict[str, Any] = {'operator': None, 'time_infos': [], 'duration': None, 'price': None, 'codes': None}
+    for el in _XP_BUS_FIELDS(bus_div):
+        classes = (el.get('class') or '').split()
+        if el.tag == 'div':
+            if 'time-info' in classes: nodes['time_infos'].append(el)
+            if 'price' in classes and nodes['price'] is None: nodes['price'] = el
+        else:
+            if 'operator-name' in classes and nodes['operator'] is None: nodes['operator'] = el
+            if 'duration' in classes and nodes['duration'] is None: nodes['duration'] = el
+            if classes == _CODES_CLASSES: nodes['codes'] = el
+    return nodes
+
+def _single_string(el: HtmlElement) -> Optional[str]:
+    """Equivalent of BeautifulSoup's Tag.string: the text of an element that has a single string descendant chain."""
+    while True:
+        if len(el) == 0:
+            return el.text
+        if len(el) > 1 or el.text or el[0].tail:
+            return None
+        el = el[0]
+
+def _first_ancestor(el: HtmlElement, tag: str) -> Optional[HtmlElement]:
+    """Equivalent of BeautifulSoup's find_parent(tag)."""
+    return next(el.iterancestors(tag), None)
+
 class BeautifulSoupParser:
     """
-    Implements the BusParser interface using BeautifulSoup for high-speed,
-    selector-based HTML parsing.    
+    Implements the BusParser interface using selector-based HTML parsing.
+    Both the main results page and the trip details pages are walked with
+    precompiled lxml XPath expressions, which keeps the traversal in C.
     """
     
     async def parse(
         self, 
         client: httpx.AsyncClient, 
-        html_content: str,
+        html_content: Union[str, bytes],
         limit: Optional[int] = None
     ) -> List[BusService]:
         """
         Parses the raw HTML search results into a structured list of BusService models.
+        The CPU-bound passes run in a worker thread so the event loop stays free.
 
         It first tries to get detailed data by calling 'loadTripDetails' for each bus
         concurrently.
         
         If 'limit' is provided, it will only process the first 'n' buses.
         """
-        soup = BeautifulSoup(html_content, 'lxml')
-        bus_services: List[BusService] = []
-            
-        detail_tasks = []
-        temp_data_list = []
-        bus_divs = soup.find_all('div', class_ = 'bus-list')
-        
-        log.info(f"BeautifulSoupParser: Starting hybrid parse. Found {len(bus_divs)} bus elements.")
-
+        # 1. Walk the results page off the event loop
+        entries = await asyncio.to_thread(self._scan_results_page, html_content, limit)
+        if not entries:
+            return []
+
+        # 2. Fetch the trip details of every bus that has an onclick, in parallel
+        onclick_attrs = [entry['onclick'] if entry is not None else "" for entry in entries]
+        log.info(f"BeautifulSoupParser: Awaiting concurrent detail fetch for {len(entries)} buses...")
+        all_details_html = await fetch_all_trip_details(client, onclick_attrs)
+
+        # 3. Merge and validate off the event loop
+        return await asyncio.to_thread(self._merge_and_validate, entries, all_details_html)
+
+    def _scan_results_page(
+        self,
+        html_content: Union[str, bytes],
+        limit: Optional[int]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        Pass 1 (CPU-bound, runs in a worker thread). Extracts everything needed
+        from each bus div so the lxml tree can be dropped before the detail calls.
+        A None entry marks a bus that failed to parse.
+        """
+        try:
+            root = lxml_html.document_fromstring(html_content, parser = _HTML_PARSER)
+        except etree.ParserError:
+            log.warning("BeautifulSoupParser: Search results page is empty.")
+            return []
+
+        entries: List[Optional[Dict[str, Any]]] = []
+        # With a limit, only the first 'n' bus elements are selected, so no
+        # element proxies are built for buses that would be thrown away.
         if limit is not None:
             log.info(f"BeautifulSoupParser: Applying limit of {limit} buses.")
-            bus_divs = bus_divs[:limit]
+            bus_divs = _XP_FIRST_N_BUS_LISTS(root, n = limit)
+        else:
+            bus_divs = _XP_BUS_LIST(root)
+        
+        log.info(f"BeautifulSoupParser: Starting hybrid parse. Found {len(bus_divs)} bus elements.")
 
-        # Scrape main list and create detail-call tasks
         for idx, bus_div in enumerate(bus_divs):
-            try:
-                # 1. Get data ONLY available in the main list 'bus_div'
-                bus_type = str(bus_div.get('data-bus-type', 'N/A')).strip()
-                seats_available = self._parse_seats(bus_div)
-                via_route_list = self._parse_via_route(bus_div)
-                
-                # 1.4 Onclick attribute - Load Trip Details
-                a_tag = bus_div.find("a", attrs={"data-target": "#TripcodePopUp", "onclick": True})
-                onclick_attr = a_tag.get("onclick", "") if a_tag else ""
-
-                # 2. Add task to get detailed HTML
-                if onclick_attr:
-                    detail_tasks.append(self._call_load_trip_details(client, str(onclick_attr), idx))
-                    log.debug(f"BS_Parser Bus {idx}: Extracted {len(re.findall(r"'([^']*)'", str(onclick_attr)))} trip detail call arguments from onclick: {onclick_attr[:50]}...")
-                else:
-                    future = asyncio.Future()
-                    future.set_result("")
-                    detail_tasks.append(future)
-                    log.warning(f"BS_Parser Bus {idx}: No 'onclick' attribute found. Cannot fetch details.")
-                    
-                temp_data_list.append({
-                    "bus_type": bus_type,
-                    "seats_available": seats_available,
-                    "via_route_list": via_route_list
-                })
-                
-            except Exception as e:
-                log.error(f"Critical error in bs_parser (Pass 1) for bus {idx}: {e}")
-                future = asyncio.Future()
-                future.set_result("")
-                detail_tasks.append(future)
-                temp_data_list.append(None)
+            entry = self._scan_bus_div(bus_div, idx)
+            if entry is not None and not entry['onclick']:
+                log.warning(f"BS_Parser Bus {idx}: No 'onclick' attribute found. Cannot fetch details.")
+            entries.append(entry)
+
+        return entries
+
+    def _scan_bus_div(self, bus_div: HtmlElement, idx: int) -> Optional[Dict[str, Any]]:
+        """Extracts one bus's main list data, or returns None if the bus failed to parse."""
+        try:
+            # 1. Get data ONLY available in the main list 'bus_div'
+            bus_type = str(bus_div.get('data-bus-type', 'N/A')).strip()
+            seats_available = self._parse_seats(bus_div)
+            via_route_list = self._parse_via_route(bus_div)
+            
+            # 1.4 Onclick attribute - Load Trip Details
+            onclick_attrs = _XP_TRIP_ONCLICK(bus_div)
+            onclick_attr = str(onclick_attrs[0]) if onclick_attrs else ""
 
-        # 3. Run all detail tasks in parallel
-        log.info(f"BeautifulSoupParser: Awaiting concurrent detail fetch for {len(detail_tasks)} buses...")
-        all_details_html = await asyncio.gather(*detail_tasks)
+            # Per-bus debug lines use lazy %-args so nothing is formatted unless DEBUG is on
+            if onclick_attr and log.isEnabledFor(logging.DEBUG):
+                log.debug("BS_Parser Bus %s: Extracted %s trip detail call arguments from onclick: %s...", idx, onclick_attr.count("'") // 2, onclick_attr[:50])
+                
+            return {
+                "bus_type": bus_type,
+                "seats_available": seats_available,
+                "via_route_list": via_route_list,
+                "onclick": onclick_attr,
+                "fallback_data": self._parse_details_from_bus_div(bus_div)
+            }
+            
+        except Exception as e:
+            log.error(f"Critical error in bs_parser (Pass 1) for bus {idx}: {e}")
+            return None
 
-        # 4. Combine main list data with detail data using the new hybrid logic
+    def _merge_and_validate(
+        self,
+        entries: List[Optional[Dict[str, Any]]],
+        all_details_html: List[str]
+    ) -> List[BusService]:
+        """
+        Pass 2 (CPU-bound, runs in a worker thread). Combines main list data with
+        the trip details, then validates all merged rows in one batch.
+        """
+        rows: List[Dict[str, Any]] = []
+        row_indices: List[int] = []
         for idx, details_html in enumerate(all_details_html):
-            main_list_data = temp_data_list[idx]
-            bus_div = bus_divs[idx]
+            main_list_data = entries[idx]
 
             if main_list_data is None:
                 continue
                 
             try:
-                parsed_details = self._parse_details_from_trip_html(details_html)
-                fallback_data = self._parse_details_from_bus_div(bus_div)
-
-                # 3. Create the final service_data, starting with fallback as base
-                service_data = {
-                    'operator': fallback_data.get('operator', 'N/A'),
-                    'trip_code': fallback_data.get('trip_code', 'N/A'),
-                    'route_code': fallback_data.get('route_code', 'N/A'),
-                    'departure_time': fallback_data.get('departure_time', 'N/A'),
-                    'arrival_time': fallback_data.get('arrival_time', 'N/A'),
-                    'duration': fallback_data.get('duration', 'N/A'),
-                    'price_in_rs': fallback_data.get('price_in_rs', 0)
-                }
-                
-                log.debug(f"BS_Parser Bus {idx}: Fallback Price: {fallback_data.get('price_in_rs')}, Trip Code: {fallback_data.get('trip_code')}")
-
-                total_kms = None
-                child_fare = None
-
-                # 4. Selectively overwrite with data from parsed_details
-                if parsed_details:
-                    service_data.update({k: v for k, v in parsed_details.items() if v})
-                    
-                    try:
-                        price_str = parsed_details.get('price_in_rs_str')
-                        if price_str:
-                            service_data['price_in_rs'] = int(price_str)
-                    except (ValueError, TypeError):
-                        pass
-                    
-                    total_kms = parsed_details.get('total_kms')
-                    child_fare = parsed_details.get('child_fare', "NA")
-                
-                log.info(f"BS_Parser Bus {idx} MERGED: Operator: {service_data['operator']}, Trip Code: {service_data['trip_code']}, Final Price: {service_data['price_in_rs']}")
-
-                # 5. Append the final merged object
-                bus_services.append(BusService(
-                    operator=service_data['operator'],
-                    bus_type=main_list_data['bus_type'],
-                    trip_code=service_data['trip_code'],
-                    route_code=service_data['route_code'],
-                    departure_time=service_data['departure_time'],
-                    arrival_time=service_data['arrival_time'],
-                    duration=service_data['duration'],
-                    price_in_rs=service_data['price_in_rs'],
-                    seats_available=main_list_data['seats_available'],
-                    via_route=main_list_data['via_route_list'],
-                    total_kms=total_kms,
-                    child_fare=child_fare
-                ))
-
+                row = self._merge_row(main_list_data, details_html, idx)
             except Exception as e:
                 log.error(f"Critical error in bs_parser (Pass 2) for bus {idx}: {e}")
                 continue
 
-        return bus_services
+            log.info(f"BS_Parser Bus {idx} MERGED: Operator: {row['operator']}, Trip Code: {row['trip_code']}, Final Price: {row['price_in_rs']}")
+            rows.append(row)
+            row_indices.append(idx)
+
+        # 6. Validate all merged rows in one pass
+        return self._validate_rows(rows, row_indices)
+
+    def _merge_row(self, main_list_data: Dict[str, Any], details_html: str, idx: int) -> Dict[str, Any]:
+        """Builds one unvalidated BusService row from a bus's main list data and its trip details HTML."""
+        parsed_details = self._parse_details_from_trip_html(details_html)
+        fallback_data = main_list_data['fallback_data']
+
+        # 3. Create the final service_data, starting with fallback as base
+        service_data = {
+            'operator': fallback_data.get('operator', 'N/A'),
+            'trip_code': fallback_data.get('trip_code', 'N/A'),
+            'route_code': fallback_data.get('route_code', 'N/A'),
+            'departure_time': fallback_data.get('departure_time', 'N/A'),
+            'arrival_time': fallback_data.get('arrival_time', 'N/A'),
+            'duration': fallback_data.get('duration', 'N/A'),
+            'price_in_rs': fallback_data.get('price_in_rs', 0)
+        }
+        
+        log.debug("BS_Parser Bus %s: Fallback Price: %s, Trip Code: %s", idx, fallback_data.get('price_in_rs'), fallback_data.get('trip_code'))
+
+        total_kms = None
+        child_fare = None
+
+        # 4. Selectively overwrite with data from parsed_details
+        if parsed_details:
+            service_data.update({k: v for k, v in parsed_details.items() if v})
+            
+            try:
+                price_str = parsed_details.get('price_in_rs_str')
+                if price_str:
+                    service_data['price_in_rs'] = int(price_str)
+            except (ValueError, TypeError):
+                pass
+            
+            total_kms = parsed_details.get('total_kms')
+            child_fare = parsed_details.get('child_fare', "NA")
+
+        # 5. The final merged row
+        return {
+            'operator': service_data['operator'],
+            'bus_type': main_list_data['bus_type'],
+            'trip_code': service_data['trip_code'],
+            'route_code': service_data['route_code'],
+            'departure_time': service_data['departure_time'],
+            'arrival_time': service_data['arrival_time'],
+            'duration': service_data['duration'],
+            'price_in_rs': service_data['price_in_rs'],
+            'seats_available': main_list_data['seats_available'],
+            'via_route': main_list_data['via_route_list'],
+            'total_kms': total_kms,
+            'child_fare': child_fare
+        }
+
+    def _extract_complete(self, main_list_data: Dict[str, Any], details_html: str, idx: int) -> Optional[BusService]:
+        """
+        Returns the bus as a BusService when the selectors found every field and the row
+        validates, or None. The LLM parsers call this first and only send the rest to the model.
+        """
+        try:
+            row = self._merge_row(main_list_data, details_html, idx)
+            if all(row[field] not in ("N/A", "") for field in _PLACEHOLDER_FIELDS) and row['price_in_rs'] > 0:
+                return BusService.model_validate(row)
+        except (ValidationError, ValueError, KeyError) as e:
+            log.debug("BS_Parser Bus %s: Deterministic extraction incomplete: %s", idx, e)
+        return None
 
     # Helpers
 
-    def _parse_seats(self, bus_div: Tag) -> int:
+    def _validate_rows(self, rows: List[Dict[str, Any]], row_indices: List[int]) -> List[BusService]:
+        """
+        Validates the merged rows with a single TypeAdapter call. Rows that fail
+        validation are logged and dropped, and the rest are validated again as a batch.
+        """
+        try:
+            return BUS_SERVICE_LIST_ADAPTER.validate_python(rows)
+        except ValidationError as e:
+            bad_rows = {err['loc'][0] for err in e.errors()}
+
+        for pos in sorted(bad_rows):
+            log.error(f"Critical error in bs_parser (Pass 2) for bus {row_indices[pos]}: invalid data {rows[pos]}")
+
+        return BUS_SERVICE_LIST_ADAPTER.validate_python([row for pos, row in enumerate(rows) if pos not in bad_rows])
+
+    def _parse_seats(self, bus_div: HtmlElement) -> int:
         """Extracts available seats from the bus_div."""
         seats_available = 0
-        seats_text_element_candidates = bus_div.find_all('span', class_ = 'text-1')
-        seats_text_element = next((s for s in seats_text_element_candidates if isinstance(s.string, str) and 'Seats Available' in s.string), None)
+        seats_text = next((text for text in map(_single_string, _XP_TEXT_1_SPANS(bus_div))
+                           if text is not None and 'Seats Available' in text), None)
         
-        if seats_text_element and seats_text_element.text is not None:
+        if seats_text is not None:
             try:
-                seats_available = int(seats_text_element.text.split(' ')[0])
+                seats_available = int(seats_text.split(' ')[0])
             except ValueError:
                 log.warning('Could not convert the number of seats to an integer.')
         return seats_available
 
-    def _parse_via_route(self, bus_div: Tag) -> Optional[List[str]]:
+    def _parse_via_route(self, bus_div: HtmlElement) -> Optional[List[str]]:
         """Extracts the 'via' route list from the bus_div."""
         via_route_list: Optional[List[str]] = None
-        via_tag_candidates = [tag for tag in bus_div.find_all('small') if tag.get('style') and 'color: blue' in tag['style']]
-        via_tag = via_tag_candidates[0] if via_tag_candidates else None
+        via_b_tags = _XP_VIA_ROUTE(bus_div)
         
-        if via_tag and via_tag.find('b'):
-            via_b_tag = via_tag.find('b')
-            if via_b_tag and via_b_tag.text is not None:
-                via_text = via_b_tag.text.strip()
-                if 'Via-' in via_text:
-                    route_string = via_text.replace('Via-', '').strip()
-                    if route_string: 
-                        via_route_list = [stop.strip() for stop in route_string.split(',') if stop.strip()]
-                        log.debug(f"BS_Parser: Extracted via route: {via_route_list}")
+        if via_b_tags:
+            via_text = via_b_tags[0].text_content().strip()
+            if 'Via-' in via_text:
+                route_string = via_text.replace('Via-', '').strip()
+                if route_string: 
+                    via_route_list = [stop.strip() for stop in route_string.split(',') if stop.strip()]
+                    log.debug("BS_Parser: Extracted via route: %s", via_route_list)
         return via_route_list
 
-    async def _call_load_trip_details(self, client: httpx.AsyncClient, onclick_attr: str, bus_index: int) -> str:
-        """Extracts arguments and calls the LoadTripDetails endpoint."""
-        args = re.findall(r"'([^']*)'", str(onclick_attr))
-        if len(args) < 6:
-            log.error(f"Failed to parse onclick_attr: {onclick_attr}")
-            return ""
-
-        data = {
-            "ServiceID": args[0], "TripCode": args[1], "StartPlaceID": args[2],
-            "EndPlaceID": args[3], "JourneyDate": args[4], "ClassID": args[5],
-        }
-
-        try:
-            response = await client.post(TNSTC_DETAILS_URL, data=data)
-            response.raise_for_status()
-            return response.text
-        except httpx.RequestError as e:
-            log.error(f"Network error calling loadTripDetails for bus {bus_index}: {e}")
-            return ""
-
     def _parse_details_from_trip_html(self, trip_html: str) -> Optional[Dict[str, Any]]:
-        """Helper to parse the detailed HTML from _call_load_trip_details."""
+        """Helper to parse the detailed HTML from fetch_trip_details."""
         if not trip_html:
             return None
         try:
-            details_soup = BeautifulSoup(trip_html, 'lxml')
+            details_root = lxml_html.document_fromstring(trip_html, parser = _HTML_PARSER)
             data: Dict[str, Any] = {}
             
-            rows = details_soup.find_all('tr')
-            details_map = self._parse_key_value_table(rows)
+            # Walk the tree once and bucket the nodes by tag; the fare and stops
+            # helpers only scan these lists instead of re-querying the whole document.
+            rows: List[HtmlElement] = []
+            strongs: List[HtmlElement] = []
+            divs: List[HtmlElement] = []
+            buckets = {'tr': rows, 'strong': strongs, 'div': divs}
+            for el in _XP_DETAIL_NODES(details_root):
+                buckets[el.tag].append(el)
+
+            details_map = self._parse_key_value_table(details_root)
             
             data['operator'] = details_map.get("Corporation")
             data['trip_code'] = details_map.get("Service Code")
@@ -216,110 +419,72 @@ class BeautifulSoupParser:
             data['total_kms'] = details_map.get("Total Kms")
             data['duration'] = details_map.get("Journey Hours")
             
-            self._parse_fares(details_soup, data)
-            self._parse_stops_table(details_soup, data)
+            self._parse_fares(strongs, divs, data)
+            self._parse_stops_table(rows, data)
             
             return data
         except Exception as e:
             log.error(f"Error parsing trip detail HTML: {e}")
             return None
 
-    def _parse_details_from_bus_div(self, bus_div: Tag) -> dict:
+    def _parse_details_from_bus_div(self, bus_div: HtmlElement) -> dict:
         """Fallback helper to scrape data from the main list div."""
-        data = {}
-        
-        op_el = bus_div.find('span', class_ = 'operator-name')
-        data['operator'] = op_el.text.strip() if op_el else "N/A"
-        
-        time_divs = bus_div.find_all('div', class_='time-info')
-
-        # Departure time
-        if len(time_divs) > 0:
-            span = time_divs[0].find('span')
-            data['departure_time'] = span.get_text(strip=True) if span else "N/A"
-        else:
-            data['departure_time'] = "N/A"
-
-        # Arrival time
-        if len(time_divs) > 2:
-            span = time_divs[2].find('span')
-            data['arrival_time'] = span.get_text(strip=True) if span else "N/A"
-        else:
-            data['arrival_time'] = "N/A"
-
-        dur_el = bus_div.find('span', class_='duration')
-        data['duration'] = dur_el.text.strip().replace('Hrs', '').strip() if dur_el and dur_el.text else "N/A"
-        
-        price = 0
-        price_div = bus_div.find('div', class_ = 'price')
-        if price_div and price_div.contents:
-            full_text = " ".join(str(el) for el in price_div.contents)
-            tokens = full_text.split()
-            try:
-                amount = next(t for t in tokens if t.isdigit())
-                price = int(amount)
-            except (StopIteration, ValueError):
-                log.warning("BS_Parser: Could not find numeric price in fallback.")
-        data['price_in_rs'] = price
-        
-        code_span = next((s for s in bus_div.find_all('span', class_ = 'text-1 text-muted d-block') if s.text and '/' in s.text), None)
-        if code_span:
-            parts = code_span.text.strip().split('/', 1)
-            data['trip_code'] = parts[0].strip()
-            data['route_code'] = parts[1].strip() if len(parts) > 1 else "N/A"
-        else:
-            data['trip_code'], data['route_code'] = "N/A", "N/A"
-            
-        return data
+        nodes = _collect_bus_fields(bus_div)
+        return {field: post(nodes) for field, post in _EXTRACTORS}
 
-    def _parse_key_value_table(self, rows: list) -> Dict[str, str]:
-        """Parses <tr> elements into a key-value map."""
+    def _parse_key_value_table(self, details_root: HtmlElement) -> Dict[str, str]:
+        """Maps the first label cell of each <tr> to the first value cell in the same row."""
         details_map = {}
-        for row in rows:
-            label_cell = row.find('td', attrs={"class": "bodytextWithSecondMainColor"})
-            value_cell = row.find('td', attrs={"class": "bodytextWithThirdMainColor"})
-            if label_cell and value_cell:
-                label = label_cell.text.replace(':', '').replace('\xa0', ' ').replace('*', '').strip()
-                value = (value_cell.find('strong') or value_cell).text.strip()
-                details_map[label] = value
+        for row in _XP_KEY_VALUE_ROWS(details_root):
+            label_cell = _XP_LABEL_CELL(row)[0]
+            value_cell = _XP_VALUE_CELL(row)[0]
+            label = label_cell.text_content().replace(':', '').replace('\xa0', ' ').replace('*', '').strip()
+            value_strong = value_cell.find('.//strong')
+            value = (value_strong if value_strong is not None else value_cell).text_content().strip()
+            details_map[label] = value
         return details_map
 
-    def _parse_fares(self, details_soup: BeautifulSoup, data: Dict[str, Any]) -> None:
+    def _parse_fares(self, strongs: List[HtmlElement], divs: List[HtmlElement], data: Dict[str, Any]) -> None:
         """Finds the Adult and Child fares."""
-        data['price_in_rs_str'] = self._find_fare_value(details_soup, r"Adult\s*Fare")
-        data['child_fare'] = self._find_fare_value(details_soup, r"Child\s*Fare")
-
-    def _find_fare_value(self, details_soup: BeautifulSoup, pattern_str: str) -> Optional[str]:
-        """Nested helper to find a specific fare by its label pattern."""
-        try:
-            fare_pattern = re.compile(pattern_str, re.IGNORECASE)
-            fare_label = details_soup.find('strong', string=fare_pattern) or details_soup.find('div', string=fare_pattern) # type: ignore
-            if not fare_label: return None
-
-            parent_div = fare_label.find_parent('div')
-            if not parent_div: return None
-            price_cell = parent_div.find_next_sibling('td')
-            if not price_cell: return None
-            
-            price_span = price_cell.find('span', class_='button')
-            if price_span:
-                return price_span.text.strip()
-        except AttributeError:
-            log.warning(f"AttributeError while parsing fare: {pattern_str}")
+        data['price_in_rs_str'] = self._find_fare_value(strongs, divs, _ADULT_FARE_RE)
+        data['child_fare'] = self._find_fare_value(strongs, divs, _CHILD_FARE_RE)
+
+    def _find_fare_value(self, strongs: List[HtmlElement], divs: List[HtmlElement], fare_pattern: re.Pattern) -> Optional[str]:
+        """Nested helper to find a specific fare by its (precompiled) label pattern."""
+        search = fare_pattern.search
+
+        def matches(el: HtmlElement) -> bool:
+            text = _single_string(el)
+            return text is not None and search(text) is not None
+
+        fare_label = next((el for el in strongs if matches(el)), None)
+        if fare_label is None:
+            fare_label = next((el for el in divs if matches(el)), None)
+        if fare_label is None: return None
+
+        parent_div = _first_ancestor(fare_label, 'div')
+        if parent_div is None: return None
+        price_cell = next(parent_div.itersiblings('td'), None)
+        if price_cell is None: return None
+        
+        price_spans = _XP_FARE_BUTTON(price_cell)
+        if price_spans:
+            return price_spans[0].text_content().strip()
         return None
 
-    def _parse_stops_table(self, details_soup: BeautifulSoup, data: Dict[str, Any]) -> None:
+    def _parse_stops_table(self, rows: List[HtmlElement], data: Dict[str, Any]) -> None:
         """Parses departure and arrival times from the stops table."""
-        list_heading_tr = details_soup.find('tr', class_='listHeading')
-        if not list_heading_tr: return
-
-        valid_rows = [r for r in list_heading_tr.find_next_siblings('tr') if r.find('td')]
-        if not valid_rows: return
-
-        try:
-            dep_cells = valid_rows[0].find_all('td')
-            if len(dep_cells) >= 4: data['departure_time'] = dep_cells[3].text.strip()
-            arr_cells = valid_rows[-1].find_all('td')
-            if len(arr_cells) >= 4: data['arrival_time'] = arr_cells[3].text.strip()
-        except IndexError:
-            log.warning("IndexError while parsing stops table rows.")
\ No newline at end of file
+        heading = next((r for r in rows if 'listHeading' in (r.get('class') or '').split()), None)
+        if heading is None: return
+
+        # Only the first and last data rows are used: walk forward from the heading to
+        # the first one, then back from the end of the table, stopping at the first hit.
+        first_row = next((r for r in heading.itersiblings('tr') if r.find('.//td') is not None), None)
+        if first_row is None: return
+        last_row = next(r for r in reversed(heading.getparent())
+                        if r is first_row or (r.tag == 'tr' and r.find('.//td') is not None))
+
+        dep_cells = first_row.findall('.//td')
+        if len(dep_cells) >= 4: data['departure_time'] = dep_cells[3].text_content().strip()
+        arr_cells = last_row.findall('.//td')
+        if len(arr_cells) >= 4: data['arrival_time'] = arr_cells[3].text_content().strip()
\ No newline at end of file
@@ -1,82 +1,75 @@
 import httpx
-from typing import List, Optional
+from typing import List, Optional, Union, Tuple, Dict, Any
 import logging
-from tenacity import wait_exponential, stop_after_attempt, Retrying
+from tenacity import wait_exponential, stop_after_attempt, AsyncRetrying
 import asyncio
-import re
-from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
+from lxml.html import HtmlElement
 from pydantic import ValidationError
 
 from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.exceptions import OutputParserException
 from langchain_core.messages import HumanMessage, SystemMessage
 
-from utils.clean_html import minify_html
+from utils.clean_html import minify_html, minify_element
 
 from .prompt_builder import PromptGenerator
 
-from ..schemas import BusService, BusServiceWithReasoning
-from ..config import GEMINI_API_KEY, GEMINI_MODEL, TNSTC_DETAILS_URL, GEMINI_LOAD_TIMEOUT
+from ..schemas import BusService, BusServiceWithReasoningList
+from .trip_details import fetch_all_trip_details
+from .response_cache import ResponseCache, bus_cache_key
+from .bs_parser import BeautifulSoupParser, _HTML_PARSER, _XP_BUS_LIST, _XP_FIRST_N_BUS_LISTS
+from ..config import (
+    GEMINI_API_KEY, GEMINI_MODEL, GEMINI_ESCALATION_MODEL, GEMINI_LOAD_TIMEOUT, GEMINI_BATCH_MAX_CHARS, GEMINI_RATE_LIMIT_COOLDOWN,
+    GEMINI_RESPONSE_CACHE_SIZE, GEMINI_RESPONSE_CACHE_TTL, GEMINI_CONCURRENCY_LIMIT, GEMINI_PARSE_TIMEOUT,
+)
 
 log = logging.getLogger(__name__)
 
-class GeminiParser:
+class _ServiceCountMismatch(Exception):
+    """The LLM returned valid output with a different number of services than buses sent."""
+
+def _is_unusable_output(e: BaseException) -> bool:
     """
-    Implements the BusParser interface using the LangChain Google Generative AI
-    model with its native structured output feature.
+    True when Gemini answered but the answer cannot be used. The structured-output chain
+    reports output that does not fit the schema as LangChain's OutputParserException, with
+    the pydantic ValidationError as its cause, rather than as the ValidationError itself.
     """
+    return isinstance(e, (ValidationError, OutputParserException, _ServiceCountMismatch)) or isinstance(e.__cause__, ValidationError)
 
-    def __init__(self):
-        if not GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY environment variable is not set. Cannot use GeminiParser.")
-        
-        try:
-            self.llm = ChatGoogleGenerativeAI(
-                model=GEMINI_MODEL, 
-                api_key=GEMINI_API_KEY,
-                request_timeout=GEMINI_LOAD_TIMEOUT
-            )
-
-            self.prompt_gen = PromptGenerator()
-
-            self.structured_llm = self.llm.with_structured_output(BusServiceWithReasoning)
-        except ImportError:
-            log.error("LangChain Google GENAI library not found. Please install 'langchain-google-genai'")
-            raise
-        except Exception as e:
-            log.error(f"Failed to initialize Gemini LLM: {e}")
-            raise
-        
-        self.system_prompt = self.prompt_gen.build_system_prompt(BusService)
-            
-    async def _parse_bus_with_langchain(
-        self,
-        main_list_html: str,
-        detail_table_html: str,
-        bus_index: int
-    ) -> Optional[BusService]:
-        """
-        Parses a single bus by sending its two HTML sources to Gemini.
-        Returns the clean BusService object (without reasoning field).
-        """
+def _is_rate_limit_error(e: BaseException) -> bool:
+    """
+    True for Gemini quota errors (HTTP 429). LangChain re-raises the client's error with
+    the original as its cause, so the whole chain is checked for a 429 status code:
+    google.genai's ClientError.code, google.api_core's ResourceExhausted.code, or an HTTP
+    response's status_code. The message is never matched, since validation errors echo
+    model output that can contain "429" (a fare, a trip code).
+    """
+    seen = set()
+    err: Optional[BaseException] = e
+    while err is not None and id(err) not in seen:
+        seen.add(id(err))
+        response = getattr(err, 'response', None)
+        if 429 in (getattr(err, 'code', None), getattr(err, 'status_code', None), getattr(response, 'status_code', None)):
+            return True
+        err = err.__cause__ or err.__context__
+    return False
 
-        user_prompt = f"""
-        You will be given two HTML fragments.
-        1. MAIN_LIST_HTML: Contains the primary data for a single bus.
+# How the buses of a batch are laid out in the user message. Static, so it lives in the system prompt.
+_BATCH_INSTRUCTIONS = """
+        You will be given one or more buses, each in a block starting with "=== BUS <index> ===".
+        Each bus has two HTML fragments.
+        1. MAIN_LIST_HTML: Contains the primary data for that bus.
         2. DETAIL_TABLE_HTML: Contains supplementary data for the same bus.
         
-        TASK:
-        Extract every available field defined in the JSON_SCHEMA from these HTML fragments and merge data from both sources.
-
-        ---
-        MAIN_LIST_HTML
-        {main_list_html}
-        ---
-        DETAIL_TABLE_HTML
-        {detail_table_html}
-        ---
+        For each bus, extract every available field defined in the JSON_SCHEMA from its two HTML fragments and merge data from both sources.
+        Never mix data between buses. Return exactly one entry in `services` per bus, in the order the buses appear.
+        """
 
+# Field-by-field extraction rules, identical for every batch, appended to the system prompt.
+_EXTRACTION_RULES = """
         TASK:
-        Extract all fields for a single JSON object. Follow these rules STRICTLY.
+        Extract all fields for each bus as its own JSON object. Follow these rules STRICTLY.
 
         **Data Location Rules (CRITICAL):**
         
@@ -124,133 +117,298 @@ class GeminiParser:
         * If a value is not found, return "NA".
 
         Return:
-        → A single JSON object that conforms exactly to the JSON_SCHEMA provided in the system prompt.
+        → A single JSON object with a `services` list that conforms exactly to the JSON_SCHEMA provided above.
         → Do not include any extra text, comments, or markdown.
         → If a value is not found, return "NA" for that field (or `null` for `via_route`).
         → Output strictly raw JSON.
         """
 
+class GeminiParser:
+    """
+    Implements the BusParser interface using the LangChain Google Generative AI
+    model with its native structured output feature.
+    """
+
+    def __init__(self):
+        if not GEMINI_API_KEY:
+            raise ValueError("GEMINI_API_KEY environment variable is not set. Cannot use GeminiParser.")
+        
+        try:
+            self.llm = ChatGoogleGenerativeAI(
+                model=GEMINI_MODEL, 
+                api_key=GEMINI_API_KEY,
+                request_timeout=GEMINI_LOAD_TIMEOUT
+            )
+
+            self.prompt_gen = PromptGenerator()
+
+            self.structured_llm = self.llm.with_structured_output(BusServiceWithReasoningList)
+
+            # Optional stronger model, used only for retries after the primary model returned unusable output
+            self.escalation_llm = None
+            if GEMINI_ESCALATION_MODEL:
+                self.escalation_llm = ChatGoogleGenerativeAI(
+                    model=GEMINI_ESCALATION_MODEL,
+                    api_key=GEMINI_API_KEY,
+                    request_timeout=GEMINI_LOAD_TIMEOUT
+                ).with_structured_output(BusServiceWithReasoningList)
+        except ImportError:
+            log.error("LangChain Google GENAI library not found. Please install 'langchain-google-genai'")
+            raise
+        except Exception as e:
+            log.error(f"Failed to initialize Gemini LLM: {e}")
+            raise
+        
+        # Everything that is the same for every call goes in the system prompt, so each request
+        # shares one long static prefix that Gemini's implicit prompt caching can reuse;
+        # the user message then carries only the bus HTML.
+        self.system_prompt = (
+            self.prompt_gen.build_system_prompt(BusServiceWithReasoningList)
+            + _BATCH_INSTRUCTIONS
+            + _EXTRACTION_RULES
+        )
+        # Built once and shared by every call; only the user message changes per batch
+        self._system_message = SystemMessage(content=self.system_prompt)
+
+        # Selector-based extractor tried before the LLM; only buses it cannot fully parse go to Gemini
+        self._extractor = BeautifulSoupParser()
+
+        # Loop time until which no batch may call Gemini, set when any batch is rate limited
+        self._circuit_open_until: float = 0.0
+        # Caps in-flight Gemini calls across all concurrent searches in this process
+        self._llm_slots = asyncio.Semaphore(GEMINI_CONCURRENCY_LIMIT)
+
+        # Parsed services per bus HTML digest, so repeat searches only send changed buses to the LLM
+        self._response_cache = ResponseCache(GEMINI_RESPONSE_CACHE_SIZE, GEMINI_RESPONSE_CACHE_TTL)
+            
+    def _build_batches(self, pending: List[Tuple[int, str, str]]) -> List[List[Tuple[int, str, str]]]:
+        """
+        Groups the buses' minified (index, main, detail) HTML into as few batches as possible,
+        starting a new batch once GEMINI_BATCH_MAX_CHARS of HTML would be exceeded.
+        Each entry keeps its bus index so results and log lines map back to the right bus.
+        """
+        batches: List[List[Tuple[int, str, str]]] = []
+        current: List[Tuple[int, str, str]] = []
+        current_chars = 0
+        for idx, main_list_html, detail_table_html in pending:
+            size = len(main_list_html) + len(detail_table_html)
+            if current and current_chars + size > GEMINI_BATCH_MAX_CHARS:
+                batches.append(current)
+                current, current_chars = [], 0
+            current.append((idx, main_list_html, detail_table_html))
+            current_chars += size
+        if current:
+            batches.append(current)
+        return batches
+
+    def _open_circuit(self) -> None:
+        """
+        Pauses every batch after a rate limit. Without this, each concurrent batch would
+        keep hitting the API on its own backoff schedule and collect its own 429s.
+        """
+        resume_at = asyncio.get_running_loop().time() + GEMINI_RATE_LIMIT_COOLDOWN
+        if resume_at > self._circuit_open_until:
+            self._circuit_open_until = resume_at
+            log.warning(f"GeminiParser: Rate limited by Gemini. Pausing all LLM calls for {GEMINI_RATE_LIMIT_COOLDOWN}s.")
+
+    async def _wait_for_circuit(self) -> None:
+        """Sleeps until the rate-limit pause set by _open_circuit, if any, is over."""
+        delay = self._circuit_open_until - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _parse_batch_with_langchain(self, batch: List[Tuple[int, str, str]]) -> List[Tuple[int, BusService]]:
+        """
+        Parses a batch of buses with a single Gemini call. The fixed instructions
+        and schema are in the system prompt, sent once per batch instead of once per bus.
+        Returns (bus index, clean BusService without reasoning field) pairs, in bus order.
+        """
+        first_index, last_index = batch[0][0], batch[-1][0]
+        bus_blocks = "\n".join(
+            f"""
+        === BUS {idx} ===
+        MAIN_LIST_HTML
+        {main_list_html}
+        ---
+        DETAIL_TABLE_HTML
+        {detail_table_html}
+        ---"""
+            for idx, main_list_html, detail_table_html in batch
+        )
+
+        user_prompt = f"""
+        Extract the {len(batch)} buses below.
+        {bus_blocks}
+        """
+
         messages = [
-            SystemMessage(content=self.system_prompt),
+            self._system_message,
             HumanMessage(content=user_prompt)
         ]
+        html_chars = sum(len(main) + len(detail) for _, main, detail in batch)
         
-        retry_config = Retrying(
+        retry_config = AsyncRetrying(
             wait=wait_exponential(multiplier=1, min=2, max=60),
             stop=stop_after_attempt(5),
             reraise=True
         )
 
-        for attempt in retry_config:
+        # Set once the primary model returns output that fails validation or has the wrong
+        # number of services; network and rate-limit errors keep retrying on the primary model
+        escalate = False
+
+        async for attempt in retry_config:
             with attempt:
-                log.info(f"LLM_Parser Bus {bus_index} (Attempt {attempt.retry_state.attempt_number}): Sending HTML (Main: {len(main_list_html)} chars, Detail: {len(detail_table_html)} chars) to LLM for structured extraction.") 
+                llm = self.escalation_llm if escalate and self.escalation_llm is not None else self.structured_llm
+                if llm is not self.structured_llm:
+                    log.warning(f"GeminiParser: Buses {first_index}-{last_index}: Retrying with escalation model {GEMINI_ESCALATION_MODEL}.")
+                log.info(f"LLM_Parser Buses {first_index}-{last_index} (Attempt {attempt.retry_state.attempt_number}): Sending {len(batch)} buses ({html_chars} chars of HTML) to LLM for structured extraction.") 
                 
                 try:
-                    service_with_reasoning = await self.structured_llm.ainvoke(messages)
+                    # The pause is checked once a slot is free, so calls queued behind the
+                    # limit also honor a rate limit hit while they were waiting
+                    async with self._llm_slots:
+                        await self._wait_for_circuit()
+                        result = await llm.ainvoke(messages)
 
-                    if isinstance(service_with_reasoning, BusServiceWithReasoning):
-                        
-                        log.info(f"LLM_Parser Bus {bus_index} SUCCESS: Extracted details for '{service_with_reasoning.operator}' (Price: {service_with_reasoning.price_in_rs}, Trip: {service_with_reasoning.trip_code}).") 
-                        if service_with_reasoning.llm_reasoning:
-                            log.info(f"LLM Reasoning for Bus {bus_index}: {service_with_reasoning.llm_reasoning}")
-                        
-                        return BusService.model_validate(service_with_reasoning.model_dump())
-                    else:
-                        log.error(f"GeminiParser: Bus {bus_index}: LangChain returned unexpected type: {type(service_with_reasoning)}")
+                    if not isinstance(result, BusServiceWithReasoningList):
+                        log.error(f"GeminiParser: Buses {first_index}-{last_index}: LangChain returned unexpected type: {type(result)}")
+                        escalate = True
                         raise TypeError("LLM returned wrong type")
+
+                    # Services are paired with buses by position, so a different count means no
+                    # entry can be trusted to belong to its bus; the batch is retried instead
+                    if len(result.services) != len(batch):
+                        raise _ServiceCountMismatch(f"Expected {len(batch)} services, LLM returned {len(result.services)}")
+
+                    services: List[Tuple[int, BusService]] = []
+                    for (idx, main_list_html, detail_table_html), service_with_reasoning in zip(batch, result.services):
+                        log.info(f"LLM_Parser Bus {idx} SUCCESS: Extracted details for '{service_with_reasoning.operator}' (Price: {service_with_reasoning.price_in_rs}, Trip: {service_with_reasoning.trip_code}).") 
+                        if service_with_reasoning.llm_reasoning:
+                            log.info(f"LLM Reasoning for Bus {idx}: {service_with_reasoning.llm_reasoning}")
+                        service = BusService.model_validate(service_with_reasoning.model_dump())
+                        self._response_cache.store(bus_cache_key(main_list_html, detail_table_html), service)
+                        services.append((idx, service))
+                    return services
                 
-                except ValidationError as e:
-                    log.error(f"LLM_Parser Bus {bus_index}: Pydantic validation failed. Input: '{user_prompt[:50]}...'. Error: {e}", exc_info=True)
-                    raise
                 except Exception as e:
-                    log.error(f"GeminiParser: Bus {bus_index}: Failed during LangChain invocation: {e}")
+                    if _is_unusable_output(e):
+                        log.error(f"LLM_Parser Buses {first_index}-{last_index}: LLM output rejected. Error: {e}")
+                        escalate = True
+                    else:
+                        if _is_rate_limit_error(e):
+                            self._open_circuit()
+                        log.error(f"GeminiParser: Buses {first_index}-{last_index}: Failed during LangChain invocation: {e}")
                     raise
 
+        return []
 
-    async def _call_load_trip_details(self, client: httpx.AsyncClient, onclick_attr: str, bus_index: int) -> str:
-        """Extracts arguments and calls the LoadTripDetails endpoint."""
-        args = re.findall(r"'([^']*)'", str(onclick_attr))
-        if len(args) < 6:
-            log.error(f"Failed to parse onclick_attr: {onclick_attr}")
-            return ""
+    def _scan_bus_list(self, html_content: Union[str, bytes], limit: Optional[int]) -> List[Tuple[HtmlElement, Optional[Dict[str, Any]]]]:
+        """
+        Finds the bus-list elements and returns each one together with its main list
+        data from BeautifulSoupParser (None if that failed), which includes the trip
+        details 'onclick' attribute. CPU-bound; runs in a worker thread.
+        The elements are kept rather than serialized, so only the buses that end up
+        going to the LLM are ever turned back into HTML.
+        """
+        try:
+            root = lxml_html.document_fromstring(html_content, parser = _HTML_PARSER)
+        except etree.ParserError:
+            return []
+        # The positional XPath stops collecting once 'limit' buses are found
+        bus_divs = _XP_FIRST_N_BUS_LISTS(root, n = limit) if limit is not None else _XP_BUS_LIST(root)
 
-        data = {
-            "ServiceID": args[0], "TripCode": args[1], "StartPlaceID": args[2],
-            "EndPlaceID": args[3], "JourneyDate": args[4], "ClassID": args[5],
-        }
+        return [(bus_div, self._extractor._scan_bus_div(bus_div, idx)) for idx, bus_div in enumerate(bus_divs)]
 
-        try:
-            response = await client.post(TNSTC_DETAILS_URL, data=data)
-            response.raise_for_status()
-            return response.text
-        except httpx.RequestError as e:
-            log.error(f"Network error calling loadTripDetails for bus {bus_index}: {e}")
-            return ""
+    def _pre_extract(
+        self,
+        buses: List[Tuple[HtmlElement, Optional[Dict[str, Any]]]],
+        all_details_html: List[str]
+    ) -> Tuple[Dict[int, BusService], List[Tuple[int, str, str]]]:
+        """
+        Parses each bus with the selector-based extractor first. Buses whose row is
+        complete and valid are returned as is; the rest are minified for the LLM as
+        (index, main, detail) HTML. CPU-bound; runs in a worker thread.
+        """
+        parsed: Dict[int, BusService] = {}
+        pending: List[Tuple[int, str, str]] = []
+        for idx, ((bus_div, main_list_data), details_html) in enumerate(zip(buses, all_details_html)):
+            service = self._extractor._extract_complete(main_list_data, details_html, idx) if main_list_data is not None else None
+            if service is not None:
+                parsed[idx] = service
+                continue
+            pending.append((idx, minify_element(bus_div), minify_html(details_html)))
+        return parsed, pending
 
     async def parse(
         self, 
         client: httpx.AsyncClient, 
-        html_content: str,
+        html_content: Union[str, bytes],
         limit: Optional[int] = None
     ) -> List[BusService]:
         """
         Parses the main HTML by finding each bus, triggering its detail
-        sub-request, and then parsing each bus individually using Gemini.
+        sub-request, and then parsing the buses the selector-based extractor
+        could not fully parse in batches using Gemini.
         """
         log.info(f"Using GeminiParser to parse bus results (LangChain strategy)...")
         
-        soup = BeautifulSoup(html_content, 'lxml')
-        bus_divs = soup.find_all('div', class_ = 'bus-list')
+        # HTML work is CPU-bound, so it runs in a worker thread to keep the event loop free
+        buses = await asyncio.to_thread(self._scan_bus_list, html_content, limit)
         
-        if not bus_divs:
+        if not buses:
             log.warning("GeminiParser: No 'div.bus-list' elements found in HTML.")
             return []
 
         if limit is not None:
             log.info(f"GeminiParser: Applying limit of {limit} buses.")
-            bus_divs = bus_divs[:limit]
-
-        # 1. Create tasks to fetch detailed HTML for all buses in parallel
-        detail_tasks = []
-        for idx, bus_div in enumerate(bus_divs):
-            a_tag = bus_div.find("a", attrs={"data-target": "#TripcodePopUp", "onclick": True})
-            onclick_attr = a_tag.get("onclick", "") if a_tag else ""
 
-            if onclick_attr:
-                detail_tasks.append(self._call_load_trip_details(client, str(onclick_attr), idx))
-            else:
-                future = asyncio.Future()
-                future.set_result("")
-                detail_tasks.append(future)
+        # 1. Fetch detailed HTML for all buses in parallel
+        onclick_attrs = [main_list_data['onclick'] if main_list_data is not None else "" for _, main_list_data in buses]
+        for idx, onclick_attr in enumerate(onclick_attrs):
+            if not onclick_attr:
                 log.warning(f"GeminiParser Bus {idx}: No 'onclick' attribute found. Cannot fetch details.")
 
-        log.info(f"GeminiParser: Awaiting concurrent detail fetch for {len(detail_tasks)} buses...")
-        all_details_html = await asyncio.gather(*detail_tasks)
+        log.info(f"GeminiParser: Awaiting concurrent detail fetch for {len(buses)} buses...")
+        all_details_html = await fetch_all_trip_details(client, onclick_attrs)
 
-        # 2. Create tasks to parse each bus using the two HTML sources
-        parsing_tasks = []
-        for idx, bus_div in enumerate(bus_divs):
-            main_list_html = minify_html(str(bus_div))
-            detail_table_html = minify_html(all_details_html[idx])
-            
-            parsing_tasks.append(
-                self._parse_bus_with_langchain(
-                    main_list_html, 
-                    detail_table_html, 
-                    idx
-                )
-            )
-        
-        # 3. Gather all parsing results
-        log.info(f"GeminiParser: Awaiting concurrent LLM parsing for {len(parsing_tasks)} buses...")
-        results = await asyncio.gather(*parsing_tasks, return_exceptions=True)
+        # 2. Keep the buses the selector-based extractor fully parsed, reuse cached results for
+        #    unchanged HTML, and group the rest into as few LLM calls as the size budget allows
+        parsed, unparsed = await asyncio.to_thread(self._pre_extract, buses, all_details_html)
+        log.info(f"GeminiParser: Extracted {len(parsed)} / {len(buses)} buses without the LLM.")
+
+        pending: List[Tuple[int, str, str]] = []
+        cache_hits = 0
+        for idx, main_list_html, detail_table_html in unparsed:
+            cached = self._response_cache.get(bus_cache_key(main_list_html, detail_table_html))
+            if cached is not None:
+                parsed[idx] = cached
+                cache_hits += 1
+            else:
+                pending.append((idx, main_list_html, detail_table_html))
+        if cache_hits:
+            log.info(f"GeminiParser: Reusing cached LLM results for {cache_hits} / {len(unparsed)} buses.")
+        batches = self._build_batches(pending)
         
-        bus_services: List[BusService] = []
-        for idx, res in enumerate(results):
-            if isinstance(res, BusService):
-                bus_services.append(res)
-            elif isinstance(res, Exception):
-                log.error(f"GeminiParser: Bus {idx}: Failed final parsing attempt after retries. Error: {res}")
-
-        log.info(f"GeminiParser: Successfully parsed {len(bus_services)} / {len(bus_divs)} bus services.")
+        # 3. Collect the parsing results. Batches still running (e.g. stuck in retries) after
+        #    GEMINI_PARSE_TIMEOUT are cancelled, so one slow batch can't hold up the whole response.
+        log.info(f"GeminiParser: Awaiting LLM parsing for {len(pending)} buses in {len(batches)} batch(es)...")
+        tasks = [asyncio.create_task(self._parse_batch_with_langchain(batch)) for batch in batches]
+        if tasks:
+            _, not_done = await asyncio.wait(tasks, timeout=GEMINI_PARSE_TIMEOUT)
+            for task in not_done:
+                task.cancel()
+            await asyncio.gather(*not_done, return_exceptions=True)
+
+        for batch, task in zip(batches, tasks):
+            if task.cancelled():
+                log.error(f"GeminiParser: Buses {batch[0][0]}-{batch[-1][0]}: Dropped after exceeding the {GEMINI_PARSE_TIMEOUT}s parse timeout.")
+            elif task.exception() is not None:
+                log.error(f"GeminiParser: Buses {batch[0][0]}-{batch[-1][0]}: Failed final parsing attempt after retries. Error: {task.exception()}")
+            else:
+                parsed.update(task.result())
+
+        bus_services = [parsed[idx] for idx in sorted(parsed)]
+
+        log.info(f"GeminiParser: Successfully parsed {len(bus_services)} / {len(buses)} bus services.")
         return bus_services
\ No newline at end of file
@@ -1,78 +1,40 @@
 import httpx
-from typing import List, Optional
-from bs4 import BeautifulSoup
+from typing import List, Optional, Union, Tuple, Dict, Any
+from lxml import etree, html as lxml_html
+from lxml.html import HtmlElement
 from pydantic import ValidationError
 
-from ..schemas import BusService
+from ..schemas import BusService, BusServiceList
 import asyncio
 import logging
-import re
-from ..config import OLLAMA_MODEL, OLLAMA_CONCURRENCY_LIMIT, TNSTC_DETAILS_URL, OLLAMA_BASE_URL
-from tenacity import wait_exponential, stop_after_attempt, Retrying
+from .trip_details import fetch_all_trip_details
+from .bs_parser import BeautifulSoupParser, _HTML_PARSER, _XP_BUS_LIST, _XP_FIRST_N_BUS_LISTS
+from .response_cache import ResponseCache, bus_cache_key
+from ..config import (
+    OLLAMA_MODEL, OLLAMA_CONCURRENCY_LIMIT, OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE, OLLAMA_LOAD_TIMEOUT,
+    OLLAMA_BATCH_SIZE, OLLAMA_NUM_CTX, OLLAMA_NUM_PREDICT,
+    OLLAMA_RESPONSE_CACHE_SIZE, OLLAMA_RESPONSE_CACHE_TTL,
+)
+from tenacity import wait_exponential, stop_after_attempt, AsyncRetrying
 
 import ollama
-import json
 
-from utils.clean_html import minify_html
+from utils.clean_html import minify_html, minify_element
 from .prompt_builder import PromptGenerator
 
 log = logging.getLogger(__name__)
 
-class OllamaParser:
-    """
-    Implements the BusParser interface using a local LLM (via the native 'ollama' client)
-    to parse HTML content chunk by chunk using JSON mode.
-    """
-
-    def __init__(self):
-        
-        try:
-            self.client = ollama.AsyncClient(host=OLLAMA_BASE_URL)
-            self.model = OLLAMA_MODEL
-            self.prompt_gen = PromptGenerator()
-            
-            self.json_schema = BusService.model_json_schema()
-
-            self.system_prompt = self.prompt_gen.build_system_prompt(BusService)
-
-            log.info(f"OllamaParser initialized with native client. Model: {self.model}. Base URL: {OLLAMA_BASE_URL}")
-            
-        except ImportError:
-            log.error("Ollama library not found. Please install 'ollama'")
-            raise
-        except Exception as e:
-            log.error(f"Failed to initialize Ollama client: {e}")
-            raise
-
-    async def _parse_chunk_with_ollama(
-        self,
-        main_list_html: str,
-        detail_table_html: str,
-        bus_index: int
-    ) -> Optional[BusService]:
-        """
-        Sends a single HTML chunk to the Ollama API for parsing and validation
-        using the native 'ollama' client's JSON mode. This method is retryable via tenacity.
-        """
-
-        user_prompt = f"""
-        You will be given two HTML fragments.
-        1. MAIN_LIST_HTML: Contains the primary data for a single bus.
+# Static task description and field-by-field extraction rules, identical for every batch.
+# They are appended to the system prompt so every call shares one long static prefix.
+_EXTRACTION_RULES = """
+        You will be given one or more buses, each in a block starting with "=== BUS <index> ===".
+        Each bus has two HTML fragments.
+        1. MAIN_LIST_HTML: Contains the primary data for that bus.
         2. DETAIL_TABLE_HTML: Contains supplementary data for the same bus.
         
         TASK:
-        Extract every available field defined in the JSON_SCHEMA from these HTML fragments and merge data from both sources.
-
-        ---
-        MAIN_LIST_HTML
-        {main_list_html}
-        ---
-        DETAIL_TABLE_HTML
-        {detail_table_html}
-        ---
-
-        TASK:
-        Extract all fields for a single JSON object. Follow these rules STRICTLY.
+        For each bus, extract every available field defined in the JSON_SCHEMA from its two HTML fragments and merge data from both sources.
+        Never mix data between buses. Follow these rules STRICTLY.
 
         **Data Location Rules (CRITICAL):**
         
@@ -120,170 +82,293 @@ class OllamaParser:
         * If a value is not found, return "NA".
 
         Return:
-        → A single JSON object that conforms exactly to the JSON_SCHEMA provided in the system prompt.
+        → A single JSON object whose `services` list holds exactly one object per bus, in the order the buses appear.
+        → Each object in `services` conforms exactly to the JSON_SCHEMA provided above.
         → Do not include any extra text, comments, or markdown.
         → If a value is not found, return "NA" for that field (or `null` for `via_route`).
         → Output strictly raw JSON.
         """
+
+# One bus's block in the user prompt; only the index and the two HTML fragments change between calls
+_BUS_BLOCK_TEMPLATE = "=== BUS {idx} ===\nMAIN_LIST_HTML\n{main}\n---\nDETAIL_TABLE_HTML\n{detail}\n---"
+
+# Retry policy shared by every call. AsyncRetrying keeps the attempt state on the
+# instance, so each call iterates over its own cheap .copy() of it. Being async, the
+# backoff sleeps without blocking the event loop for the other buses.
+_RETRY_POLICY = AsyncRetrying(
+    wait=wait_exponential(multiplier=1, min=2, max=30),
+    stop=stop_after_attempt(3),
+    reraise=True
+)
+
+# A batch's fallback retries each bus once, already schema-constrained, so a bad
+# batch costs at most its own attempts plus one call per bus
+_SINGLE_ATTEMPT = AsyncRetrying(stop=stop_after_attempt(1), reraise=True)
+
+
+class _ServiceCountMismatch(Exception):
+    """The LLM returned valid JSON with a different number of services than buses sent."""
+
+
+class OllamaParser:
+    """
+    Implements the BusParser interface using a local LLM (via the native 'ollama' client)
+    to parse HTML content in small batches of buses using JSON mode.
+    """
+
+    def __init__(self):
         
+        try:
+            self.client = ollama.AsyncClient(host=OLLAMA_BASE_URL, timeout=OLLAMA_LOAD_TIMEOUT)
+            self.model = OLLAMA_MODEL
+            self.prompt_gen = PromptGenerator()
+            
+            # Each call returns a batch of buses, so the constrained output is the list wrapper.
+            # Only used for retries once plain JSON mode has returned invalid output.
+            self.json_schema = BusServiceList.model_json_schema()
+
+            self.system_prompt = self.prompt_gen.build_system_prompt(BusService) + _EXTRACTION_RULES
+            # Built once and shared by every call; only the user message changes per batch
+            self._system_message = {'role': 'system', 'content': self.system_prompt}
+            # A fixed context size keeps every call on the same loaded runner
+            self._options = {'temperature': 0.0, 'num_ctx': OLLAMA_NUM_CTX, 'num_predict': OLLAMA_NUM_PREDICT * OLLAMA_BATCH_SIZE}
+
+            # Selector-based extractor tried before the LLM; only buses it cannot fully parse go to Ollama
+            self._extractor = BeautifulSoupParser()
+
+            # Caps in-flight Ollama calls across all concurrent searches in this process
+            self._llm_slots = asyncio.Semaphore(OLLAMA_CONCURRENCY_LIMIT)
+
+            # Parsed services per bus HTML digest, so repeat searches only send changed buses to the LLM
+            self._response_cache = ResponseCache(OLLAMA_RESPONSE_CACHE_SIZE, OLLAMA_RESPONSE_CACHE_TTL)
+
+            log.info(f"OllamaParser initialized with native client. Model: {self.model}. Base URL: {OLLAMA_BASE_URL}")
+            
+        except ImportError:
+            log.error("Ollama library not found. Please install 'ollama'")
+            raise
+        except Exception as e:
+            log.error(f"Failed to initialize Ollama client: {e}")
+            raise
+
+    def _build_batches(self, pending: List[Tuple[int, str, str]]) -> List[List[Tuple[int, str, str]]]:
+        """
+        Groups the buses' minified (index, main, detail) HTML into batches of
+        OLLAMA_BATCH_SIZE. Each entry keeps its bus index so results and log
+        lines map back to the right bus.
+        """
+        return [pending[start:start + OLLAMA_BATCH_SIZE] for start in range(0, len(pending), OLLAMA_BATCH_SIZE)]
+
+    async def _parse_batch_with_ollama(
+            self,
+            batch: List[Tuple[int, str, str]],
+            retry_policy: AsyncRetrying = _RETRY_POLICY,
+            constrained: bool = False
+        ) -> List[Tuple[int, BusService]]:
+        """
+        Sends a batch of buses to the Ollama API in a single call for parsing and
+        validation using the native 'ollama' client's JSON mode. This method is
+        retryable via tenacity. Returns (bus index, BusService) pairs, in bus order.
+        """
+        first_index, last_index = batch[0][0], batch[-1][0]
+        bus_blocks = "\n".join(
+            _BUS_BLOCK_TEMPLATE.format(idx=idx, main=main_list_html, detail=detail_table_html)
+            for idx, main_list_html, detail_table_html in batch
+        )
+
         messages = [
-            {'role': 'system', 'content': self.system_prompt},
-            {'role': 'user', 'content': user_prompt}
+            self._system_message,
+            {'role': 'user', 'content': f"Extract the {len(batch)} buses below.\n{bus_blocks}"}
         ]
-        
-        retry_config = Retrying(
-            wait=wait_exponential(multiplier=1, min=2, max=30),
-            stop=stop_after_attempt(3),
-            reraise=True
-        )
+        html_chars = sum(len(main) + len(detail) for _, main, detail in batch)
 
+        # Plain JSON mode skips the per-token schema grammar and is enough for well-behaved
+        # output; 'constrained' is set once the model returns JSON that fails validation,
+        # switching the remaining attempts to schema-constrained decoding. Network errors
+        # keep plain mode. The single-bus fallback starts out constrained.
         json_content = "" 
-        for attempt in retry_config:
+        async for attempt in retry_policy.copy():
             with attempt:
-                log.info(f"LLM_Parser Bus {bus_index} (Attempt {attempt.retry_state.attempt_number}): Sending HTML (Main: {len(main_list_html)} chars, Detail: {len(detail_table_html)} chars) to Ollama for JSON extraction.") 
+                log.info(f"LLM_Parser Buses {first_index}-{last_index} (Attempt {attempt.retry_state.attempt_number}): Sending {len(batch)} buses ({html_chars} chars of HTML) to Ollama for {'schema-constrained' if constrained else 'plain'} JSON extraction.") 
 
                 try:
                     response = await self.client.chat(
                         model=self.model,
                         messages=messages,
                         
-                        format=self.json_schema,
-                        options={
-                            'temperature': 0.0
-                        }
+                        format=self.json_schema if constrained else 'json',
+                        keep_alive=OLLAMA_KEEP_ALIVE,
+                        options=self._options
                     )
 
                     json_content = response['message']['content']
                     
-                    service = BusService.model_validate_json(json_content)
+                    result = BusServiceList.model_validate_json(json_content)
 
-                    log.info(f"LLM_Parser Bus {bus_index} SUCCESS: Extracted details for '{service.operator}' (Price: {service.price_in_rs}, Trip: {service.trip_code}).") 
-                    return service
+                    # Results are paired with their buses by position, so a miscounted list
+                    # is retried rather than risk attaching data to the wrong bus
+                    if len(result.services) != len(batch):
+                        log.error(f"LLM_Parser Buses {first_index}-{last_index}: Expected {len(batch)} services, LLM returned {len(result.services)}.")
+                        constrained = True
+                        raise _ServiceCountMismatch(f"expected {len(batch)} services, got {len(result.services)}")
+
+                    services: List[Tuple[int, BusService]] = []
+                    for (idx, main_list_html, detail_table_html), service in zip(batch, result.services):
+                        self._response_cache.store(bus_cache_key(main_list_html, detail_table_html), service)
+                        log.info(f"LLM_Parser Bus {idx} SUCCESS: Extracted details for '{service.operator}' (Price: {service.price_in_rs}, Trip: {service.trip_code}).") 
+                        services.append((idx, service))
+                    return services
                 
-                except json.JSONDecodeError as e:
-                    log.error(f"LLM_Parser Bus {bus_index}: Failed to decode JSON from LLM. Content: '{json_content[:150]}...'. Error: {e}", exc_info=True)
-                    raise
                 except ValidationError as e:
-                    log.error(f"LLM_Parser Bus {bus_index}: Pydantic validation failed. Input: '{json_content[:150]}...'. Error: {e}", exc_info=True) 
+                    log.error(f"LLM_Parser Buses {first_index}-{last_index}: Pydantic validation failed. Input: '{json_content[:150]}...'. Error: {e}") 
+                    constrained = True
+                    raise
+                except _ServiceCountMismatch:
                     raise
                 except Exception as e:
                     log.error(f"OLLAMA_LOAD_TIMEOUT may be too low. Error during Ollama chat invocation: {e}", exc_info=True)
                     raise
 
+        return []
 
-    async def _wrapper_parse_chunk(
+
+    async def _wrapper_parse_batch(
             self, 
             semaphore: asyncio.Semaphore, 
-            main_list_html: str, 
-            detail_table_html: str,
-            idx: int
-        ) -> Optional[BusService]:
+            batch: List[Tuple[int, str, str]],
+            retry_policy: AsyncRetrying = _RETRY_POLICY,
+            constrained: bool = False
+        ) -> List[Tuple[int, BusService]]:
             """
             A wrapper that acquires the semaphore before calling the
-            parsing function.
+            parsing function. Returns the (bus index, BusService) pairs, so
+            results can be collected in completion order. A batch whose output
+            is still invalid after its retries is split, and each bus gets one
+            schema-constrained attempt on its own. Other failures, such as
+            timeouts, would fail the single calls too, so they are not split.
             """
-            log.debug(f"OllamaParser: [SEMAPHORE WAITING] for bus {idx}...")
+            first_index, last_index = batch[0][0], batch[-1][0]
+            log.debug(f"OllamaParser: [SEMAPHORE WAITING] for buses {first_index}-{last_index}...")
             async with semaphore:
-                log.info(f"OllamaParser: [SEMAPHORE ACQUIRED] Bus {idx}. Remaining slots: {semaphore._value}")
+                log.info(f"OllamaParser: [SEMAPHORE ACQUIRED] Buses {first_index}-{last_index}. Remaining slots: {semaphore._value}")
                 try:
-                    return await self._parse_chunk_with_ollama(
-                        main_list_html, 
-                        detail_table_html, 
-                        idx
-                    )
+                    return await self._parse_batch_with_ollama(batch, retry_policy, constrained)
+                except (ValidationError, _ServiceCountMismatch) as e:
+                    log.error(f"OllamaParser: Buses {first_index}-{last_index}: Failed final parsing attempt after retries. Error: {e}")
+                except Exception as e:
+                    log.error(f"OllamaParser: Buses {first_index}-{last_index}: Failed final parsing attempt after retries. Error: {e}")
+                    return []
                 finally:
-                    log.debug(f"OllamaParser: [SEMAPHORE RELEASED] Finished chunk {idx}.")
+                    log.debug(f"OllamaParser: [SEMAPHORE RELEASED] Finished buses {first_index}-{last_index}.")
 
-    async def _call_load_trip_details(self, client: httpx.AsyncClient, onclick_attr: str, bus_index: int) -> str:
-        """Extracts arguments and calls the LoadTripDetails endpoint."""
-        args = re.findall(r"'([^']*)'", str(onclick_attr))
-        if len(args) < 6:
-            log.error(f"Failed to parse onclick_attr: {onclick_attr}")
-            return ""
-
-        data = {
-            "ServiceID": args[0], "TripCode": args[1], "StartPlaceID": args[2],
-            "EndPlaceID": args[3], "JourneyDate": args[4], "ClassID": args[5],
-        }
+            if len(batch) == 1:
+                return []
+            log.warning(f"OllamaParser: Buses {first_index}-{last_index}: Retrying each bus once on its own.")
+            singles = await asyncio.gather(*(self._wrapper_parse_batch(semaphore, [entry], _SINGLE_ATTEMPT, True) for entry in batch))
+            return [pair for pairs in singles for pair in pairs]
 
+    def _scan_bus_list(self, html_content: Union[str, bytes], limit: Optional[int]) -> List[Tuple[HtmlElement, Optional[Dict[str, Any]]]]:
+        """
+        Finds the bus-list elements and returns each one together with its main list
+        data from BeautifulSoupParser (None if that failed), which includes the trip
+        details 'onclick' attribute. CPU-bound; runs in a worker thread.
+        The elements are kept rather than serialized, so only the buses that end up
+        going to the LLM are ever turned back into HTML.
+        """
         try:
-            response = await client.post(TNSTC_DETAILS_URL, data=data)
-            response.raise_for_status()
-            return response.text
-        except httpx.RequestError as e:
-            log.error(f"Network error calling loadTripDetails for bus {bus_index}: {e}")
-            return ""
+            root = lxml_html.document_fromstring(html_content, parser = _HTML_PARSER)
+        except etree.ParserError:
+            return []
+        # The positional XPath stops collecting once 'limit' buses are found
+        bus_divs = _XP_FIRST_N_BUS_LISTS(root, n = limit) if limit is not None else _XP_BUS_LIST(root)
+
+        return [(bus_div, self._extractor._scan_bus_div(bus_div, idx)) for idx, bus_div in enumerate(bus_divs)]
+
+    def _pre_extract(
+        self,
+        buses: List[Tuple[HtmlElement, Optional[Dict[str, Any]]]],
+        all_details_html: List[object]
+    ) -> Tuple[Dict[int, BusService], List[Tuple[int, str, str]]]:
+        """
+        Parses each bus with the selector-based extractor first. Buses whose row is
+        complete and valid are returned as is; the rest are minified for the LLM as
+        (index, main, detail) HTML in a single pass each, since the minifier already
+        collapses newlines with the rest of the whitespace. CPU-bound; runs in a worker thread.
+        """
+        parsed: Dict[int, BusService] = {}
+        pending: List[Tuple[int, str, str]] = []
+        for idx, ((bus_div, main_list_data), details_html) in enumerate(zip(buses, all_details_html)):
+            if main_list_data is not None:
+                # Failed detail fetches come back as exceptions; the selectors then use the main list only
+                trip_html = details_html if isinstance(details_html, str) else ""
+                service = self._extractor._extract_complete(main_list_data, trip_html, idx)
+                if service is not None:
+                    parsed[idx] = service
+                    continue
+            pending.append((idx, minify_element(bus_div), minify_html(str(details_html))))
+        return parsed, pending
 
     async def parse(
         self, 
         client: httpx.AsyncClient, 
-        html_content: str,
+        html_content: Union[str, bytes],
         limit: Optional[int] = None
     ) -> List[BusService]:
         """
         Parses the main HTML by finding each bus, triggering its detail
-        sub-request, and then parsing each bus individually using Ollama.
+        sub-request, and then parsing the buses the selector-based extractor
+        could not fully parse in small batches using Ollama.
         """
         
         log.info(f"Using OllamaParser with model {OLLAMA_MODEL} (Native client strategy)...")
-        semaphore = asyncio.Semaphore(OLLAMA_CONCURRENCY_LIMIT)
         log.info(f"Ollama concurrency limited to {OLLAMA_CONCURRENCY_LIMIT} simultaneous requests.")
 
-        soup = BeautifulSoup(html_content, 'lxml')
-        bus_divs = soup.find_all('div', class_ = 'bus-list')
+        # HTML work is CPU-bound, so it runs in a worker thread to keep the event loop free
+        buses = await asyncio.to_thread(self._scan_bus_list, html_content, limit)
         
-        if not bus_divs:
+        if not buses:
             log.warning("OllamaParser: No 'div.bus-list' elements found in HTML.")
             return []
         
         if limit is not None:
             log.info(f"OllamaParser: Applying limit of {limit} buses.")
-            bus_divs = bus_divs[:limit]
 
-        # 1. Create tasks to fetch detailed HTML for all buses in parallel
-        detail_tasks = []
-        for idx, bus_div in enumerate(bus_divs):
-            a_tag = bus_div.find("a", attrs={"data-target": "#TripcodePopUp", "onclick": True})
-            onclick_attr = a_tag.get("onclick", "") if a_tag else ""
-
-            if onclick_attr:
-                detail_tasks.append(self._call_load_trip_details(client, str(onclick_attr), idx))
-            else:
-                future = asyncio.Future()
-                future.set_result("")
-                detail_tasks.append(future)
+        # 1. Fetch detailed HTML for all buses in parallel
+        onclick_attrs = [main_list_data['onclick'] if main_list_data is not None else "" for _, main_list_data in buses]
+        for idx, onclick_attr in enumerate(onclick_attrs):
+            if not onclick_attr:
                 log.warning(f"OllamaParser Bus {idx}: No 'onclick' attribute found. Cannot fetch details.")
         
-        log.info(f"OllamaParser: Awaiting concurrent detail fetch for {len(detail_tasks)} buses...")
-        all_details_html = await asyncio.gather(*detail_tasks, return_exceptions=True)
-
-        # 2. Create tasks to parse each bus using the two HTML sources
-        tasks = []
-        for idx, bus_div in enumerate(bus_divs):
-            main_list_html = re.sub(r"[\r\n]+", "", str(bus_div))
-            detail_table_html = re.sub(r"[\r\n]+", "", str(all_details_html[idx]))
-
-            main_list_html = minify_html(main_list_html)
-            detail_table_html = minify_html(detail_table_html)
-            tasks.append(
-                self._wrapper_parse_chunk(
-                    semaphore, 
-                    main_list_html, 
-                    detail_table_html, 
-                    idx
-                )
-            )
-        
-        log.info(f"OllamaParser: Awaiting concurrent LLM parsing for {len(tasks)} buses...")
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        log.info(f"OllamaParser: Awaiting concurrent detail fetch for {len(buses)} buses...")
+        all_details_html = await fetch_all_trip_details(client, onclick_attrs, return_exceptions = True)
+
+        # 2. Keep the buses the selector-based extractor fully parsed
+        parsed, pending = await asyncio.to_thread(self._pre_extract, buses, all_details_html)
+        log.info(f"OllamaParser: Extracted {len(parsed)} / {len(buses)} buses without the LLM.")
+
+        # 3. Reuse cached results for buses whose HTML is unchanged, and create tasks
+        #    to parse the rest in batches using the two HTML sources
+        uncached: List[Tuple[int, str, str]] = []
+        for idx, main_list_html, detail_table_html in pending:
+            cached = self._response_cache.get(bus_cache_key(main_list_html, detail_table_html))
+            if cached is not None:
+                parsed[idx] = cached
+            else:
+                uncached.append((idx, main_list_html, detail_table_html))
+        if len(uncached) < len(pending):
+            log.info(f"OllamaParser: Reusing cached LLM results for {len(pending) - len(uncached)} / {len(pending)} buses.")
+
+        batches = self._build_batches(uncached)
+        tasks = [self._wrapper_parse_batch(self._llm_slots, batch) for batch in batches]
         
-        bus_services: List[BusService] = []
-        for idx, res in enumerate(results):
-            if isinstance(res, BusService):
-                bus_services.append(res)
-            elif isinstance(res, Exception):
-                log.error(f"OllamaParser: Bus {idx}: Failed final parsing attempt after retries. Error: {res}")
+        # Each batch's results are stored as soon as it finishes, rather than holding
+        # every result until the slowest batch returns
+        log.info(f"OllamaParser: Awaiting concurrent LLM parsing for {len(uncached)} buses in {len(batches)} batch(es)...")
+        for next_done in asyncio.as_completed(tasks):
+            parsed.update(await next_done)
+
+        bus_services = [parsed[idx] for idx in sorted(parsed)]
         
-        log.info(f"OllamaParser: Successfully parsed {len(bus_services)} / {len(bus_divs)} bus services.")
+        log.info(f"OllamaParser: Successfully parsed {len(bus_services)} / {len(buses)} bus services.")
         
         return bus_services
\ No newline at end of file
@@ -1,12 +1,8 @@
 import json
-from pydantic import BaseModel
-from typing import Type, Any
-from ..schemas import *
+import inspect
 from pydantic import BaseModel
 from typing import Type, Any, get_args
-import json
-import json
-import inspect
+from ..schemas import *
 
 def _get_base_type(type_hint: Any) -> Any:
     """Recursively resolves the inner type from complex type hints (e.g., Optional, List)."""
@@ -0,0 +1,40 @@
+import hashlib
+import time
+from typing import Dict, Optional, Tuple
+from ..schemas import BusService
+
+def bus_cache_key(main_list_html: str, detail_table_html: str) -> str:
+    """Digest of one bus's minified HTML, used as its LLM result cache key."""
+    return hashlib.blake2b(f"{main_list_html}\0{detail_table_html}".encode(), digest_size = 16).hexdigest()
+
+class ResponseCache:
+    """
+    In-memory cache of LLM-parsed services keyed by bus_cache_key. Identical HTML
+    means an identical answer, so on repeat searches only the buses whose HTML
+    changed (e.g. seat counts) go to the LLM. Entries expire after 'ttl' seconds
+    and the oldest entry is evicted once 'maxsize' is reached.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Insertion ordered, so the first key is always the oldest entry
+        self._entries: Dict[str, Tuple[float, BusService]] = {}
+
+    def get(self, cache_key: str) -> Optional[BusService]:
+        """Returns the cached service for a key, dropping the entry if it has expired."""
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            return None
+        expires_at, service = entry
+        if expires_at < time.monotonic():
+            del self._entries[cache_key]
+            return None
+        return service
+
+    def store(self, cache_key: str, service: BusService) -> None:
+        """Caches one bus's result, evicting the oldest entry once maxsize is reached."""
+        self._entries.pop(cache_key, None)
+        self._entries[cache_key] = (time.monotonic() + self.ttl, service)
+        if len(self._entries) > self.maxsize:
+            del self._entries[next(iter(self._entries))]
\ No newline at end of file
@@ -0,0 +1,75 @@
+import httpx
+import asyncio
+import logging
+from typing import Any, List
+from async_lru import alru_cache
+from ..config import TNSTC_DETAILS_URL, TRIP_DETAILS_CONCURRENCY_LIMIT, TRIP_DETAILS_CACHE_SIZE, TRIP_DETAILS_CACHE_TTL
+
+log = logging.getLogger(__name__)
+
+async def fetch_all_trip_details(
+    client: httpx.AsyncClient,
+    onclick_attrs: List[str],
+    return_exceptions: bool = False
+) -> List[Any]:
+    """
+    Fetches the trip-details HTML of every bus, returned in bus order. Only buses
+    with an onclick attribute get a request; the others are filled with "" afterwards
+    instead of scheduling placeholder futures. At most TRIP_DETAILS_CONCURRENCY_LIMIT
+    requests run at once, so large result pages don't hammer TNSTC.
+    """
+    semaphore = asyncio.Semaphore(TRIP_DETAILS_CONCURRENCY_LIMIT)
+    fetch_indices = [idx for idx, onclick_attr in enumerate(onclick_attrs) if onclick_attr]
+    fetched = await asyncio.gather(
+        *(fetch_trip_details(client, onclick_attrs[idx], idx, semaphore) for idx in fetch_indices),
+        return_exceptions = return_exceptions,
+    )
+
+    all_details_html: List[Any] = [""] * len(onclick_attrs)
+    for idx, details_html in zip(fetch_indices, fetched):
+        all_details_html[idx] = details_html
+    return all_details_html
+
+async def fetch_trip_details(
+    client: httpx.AsyncClient, 
+    onclick_attr: str, 
+    bus_index: int, 
+    semaphore: asyncio.Semaphore
+) -> str:
+    """
+    Extracts the loadTripDetails arguments from a bus's onclick attribute and
+    returns the trip-details HTML, holding a semaphore slot for the lookup.
+    Shared by every parser strategy.
+    """
+    # Odd-indexed pieces sit between a pair of quotes: the single-quoted call arguments
+    args = onclick_attr.split("'")[1:-1:2]
+    if len(args) < 6:
+        log.error(f"Failed to parse onclick_attr: {onclick_attr}")
+        return ""
+
+    try:
+        async with semaphore:
+            return await _load_trip_details(client, *args[:6])
+    except httpx.RequestError as e:
+        log.error(f"Network error calling loadTripDetails for bus {bus_index}: {e}")
+        return ""
+
+@alru_cache(maxsize=TRIP_DETAILS_CACHE_SIZE, ttl=TRIP_DETAILS_CACHE_TTL)
+async def _load_trip_details(
+    client: httpx.AsyncClient,
+    service_id: str, trip_code: str, start_place_id: str,
+    end_place_id: str, journey_date: str, class_id: str,
+) -> str:
+    """
+    Performs the actual LoadTripDetails POST. Keyed on the full argument tuple, so
+    the same trip on the same date is fetched once per TTL across searches, and
+    concurrent misses for the same key share one in-flight request. Errors are
+    raised rather than cached.
+    """
+    data = {
+        "ServiceID": service_id, "TripCode": trip_code, "StartPlaceID": start_place_id,
+        "EndPlaceID": end_place_id, "JourneyDate": journey_date, "ClassID": class_id,
+    }
+    response = await client.post(TNSTC_DETAILS_URL, data=data)
+    response.raise_for_status()
+    return response.text
\ No newline at end of file
@@ -1,8 +1,11 @@
-from pydantic import BaseModel, Field, field_validator, computed_field
+from pydantic import BaseModel, Field, TypeAdapter, field_validator, computed_field
 from typing import Optional, List
 from datetime import datetime
 import re
 
+_TIME_RE = re.compile(r'([01]\d|2[0-3]):[0-5]\d')
+_CODE_RE = re.compile(r'[A-Z]{3}')
+
 class PlaceInfo(BaseModel):
     """Internal model used to store the parsed ID, Code, and Name for a location."""
 
@@ -37,7 +40,7 @@ class PlaceInfo(BaseModel):
     @field_validator('code')
     @classmethod
     def code_must_be_three_uppercase_letters(cls, v: str) -> str:
-        if not re.fullmatch(r'[A-Z]{3}', v):
+        if not _CODE_RE.fullmatch(v):
             raise ValueError('code must be exactly three uppercase letters')
         return v
 
@@ -121,7 +124,7 @@ class BusService(BaseModel):
     @field_validator('departure_time', 'arrival_time')
     @classmethod
     def validate_time_format(cls, v: str) -> str:
-        if not re.fullmatch(r'([01]\d|2[0-3]):[0-5]\d', v):
+        if not _TIME_RE.fullmatch(v):
             raise ValueError('time must be in HH:MM 24-hour format')
         return v
 
@@ -173,6 +176,9 @@ class BusService(BaseModel):
             return "NA"
         return v
 
+# Validates a whole page of bus services in one call; built once at import time.
+BUS_SERVICE_LIST_ADAPTER: TypeAdapter[List[BusService]] = TypeAdapter(List[BusService])
+
 
 class SearchRequest(BaseModel):
     """Input model defining the required parameters for a bus search, now including optional filters."""
@@ -253,7 +259,7 @@ class SearchRequest(BaseModel):
     @field_validator('min_departure_time', 'max_departure_time', mode='before')
     @classmethod
     def validate_time_format(cls, v: Optional[str]) -> Optional[str]:
-        if v is not None and not re.fullmatch(r'([01]\d|2[0-3]):[0-5]\d', v):
+        if v is not None and not _TIME_RE.fullmatch(v):
             raise ValueError('time must be in HH:MM 24-hour format')
         return v
     
@@ -349,4 +355,22 @@ class BusServiceWithReasoning(BusService):
     llm_reasoning: Optional[str] = Field(
         default=None, 
         description="**LLM REASONING ONLY:** A concise, step-by-step summary of how you found each value. For Price, Duration, and Seats, you MUST specify if the value came from the 'Main List HTML' or the 'Details Page HTML'. (e.g., 'Price (350) and Seats (20) from Main List. Duration (7.45) from Details Page.' Also include how fallbacks were decided and why ?)"
+    )
+
+class BusServiceWithReasoningList(BaseModel):
+    """
+    Temporary schema used by the LLM to return a whole batch of buses in one response.
+    """
+    services: List[BusServiceWithReasoning] = Field(
+        ..., 
+        description="One entry per bus in the prompt, in the same order the buses appear."
+    )
+
+class BusServiceList(BaseModel):
+    """
+    Temporary schema used by the Ollama parser to return a whole batch of buses in one response.
+    """
+    services: List[BusService] = Field(
+        ..., 
+        description="One entry per bus in the prompt, in the same order the buses appear."
     )
\ No newline at end of file
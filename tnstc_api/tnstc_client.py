@@ -1,28 +1,52 @@
 import httpx
 from fastapi import HTTPException, status
-from typing import List, Optional
+from typing import List, Optional, Union
 from .schemas import PlaceInfo, BusService, SearchRequest 
-import re
 import logging
-from utils.logging_setup import setup_logging
 from async_lru import alru_cache
-from .config import TNSTC_BASE_URL
+from .config import TNSTC_BASE_URL, PLACE_CACHE_SIZE, PLACE_CACHE_TTL
 
 from .parsers import get_parser
 from .parsers.base import BusParser
 
-setup_logging()
 log = logging.getLogger(__name__)
 
 
 # Get Place Information
 
-@alru_cache(maxsize=128)
+class _PlaceQuery:
+    """
+    A place name as the caller gave it. It hashes and compares on the stripped,
+    lowercased name only, so it can be the alru_cache key for differently cased
+    or padded spellings, while the name itself is sent upstream unchanged.
+    """
+    __slots__ = ('name', 'key')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.key = name.strip().lower()
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _PlaceQuery) and self.key == other.key
+
 async def get_place_info(client: httpx.AsyncClient, place_name: str, is_from_place: bool) -> PlaceInfo:
     """
     Retrieves the internal ID and Code for a given place name.
-    Results are cached in memory.
+    Results are cached in memory, keyed on the normalized place name, so
+    "Dharmapuri" and " DHARMAPURI" share a single upstream lookup.
     """
+    return await _lookup_place(client, _PlaceQuery(place_name), is_from_place)
+
+@alru_cache(maxsize=PLACE_CACHE_SIZE, ttl=PLACE_CACHE_TTL)
+async def _lookup_place(client: httpx.AsyncClient, query: _PlaceQuery, is_from_place: bool) -> PlaceInfo:
+    """
+    Performs the actual place lookup against TNSTC with the caller's place name.
+    Concurrent misses for the same key share one in-flight request.
+    """
+    place_name = query.name
     action = "LoadFromPlaceList" if is_from_place else "LoadTOPlaceList"
     match_param = "matchStartPlace" if is_from_place else "matchEndPlace"
     data = { "hiddenAction": action, match_param: place_name }
@@ -36,15 +60,15 @@ async def get_place_info(client: httpx.AsyncClient, place_name: str, is_from_pla
     except httpx.RequestError as e:
         raise HTTPException(status_code = status.HTTP_503_SERVICE_UNAVAILABLE, detail = f"External API network error during place lookup: {e}")
 
-    raw_response = response.text.strip()
-    place_list = [item for item in raw_response.split('^') if item]
+    # Only the first '^'-separated record is used, so stop scanning there
+    # instead of splitting the whole match list.
+    first_match = response.text.strip().lstrip('^').partition('^')[0]
     
-    if not place_list:
+    if not first_match:
         raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, 
                             detail = f"Could not find exact place match for: {place_name}.")
 
-    first_match = place_list[0]
-    parts = first_match.split(':')
+    parts = first_match.split(':', 2)
     
     if len(parts) < 3:
         raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, 
@@ -58,7 +82,7 @@ async def get_place_info(client: httpx.AsyncClient, place_name: str, is_from_pla
 
 async def parse_bus_results(
     client: httpx.AsyncClient, 
-    html_content: str, 
+    html_content: Union[str, bytes], 
     limit: Optional[int] = None
 ) -> List[BusService]:
     """
@@ -85,7 +109,14 @@ def filter_bus_services(
     bus_list: List[BusService], 
     request: SearchRequest
 ) -> List[BusService]:
-    """Applies price, time, and bus type filters to the parsed list of bus services."""
+    """
+    Applies price, time, and bus type filters to the parsed list of bus services.
+
+    All loop-invariant work (bounds, allowed types) is done once up front, so each
+    service costs a few comparisons and one set lookup. Both the request bounds and
+    the services' departure times are validated as zero-padded 24-hour HH:MM, so
+    plain string comparison orders them chronologically with no conversion.
+    """
     
     filtered_services = []
 
@@ -94,32 +125,20 @@ def filter_bus_services(
     min_price = request.min_price_in_rs if request.min_price_in_rs is not None else 0
     max_price = request.max_price_in_rs if request.max_price_in_rs is not None else float('inf')
     
-    min_dep_int = int(min_dep_str.replace(':', ''))
-    max_dep_int = int(max_dep_str.replace(':', ''))
-    
-    allowed_types_lower = {t.lower() for t in request.allowed_bus_types} if request.allowed_bus_types else None
+    allowed_types_lower = frozenset(t.lower() for t in request.allowed_bus_types) if request.allowed_bus_types else None
     
     log.info(f"Applying filters: Price ({min_price}-{max_price}), Time ({min_dep_str}-{max_dep_str}), Types: {allowed_types_lower if allowed_types_lower else 'All'}") 
 
     for service in bus_list:
         try:
-            price_ok = (service.price_in_rs >= min_price) and (service.price_in_rs <= max_price)
-
-            if not re.fullmatch(r'([01]\d|2[0-3]):[0-5]\d', service.departure_time):
-                log.warning(f"Skipping service with invalid departure time: {service.departure_time}")
-                continue 
-                
-            dep_time_int = int(service.departure_time.replace(':', ''))
-            time_ok = (dep_time_int >= min_dep_int) and (dep_time_int <= max_dep_int)
-            
-            type_ok = True
-            if allowed_types_lower is not None:
-                type_ok = service.bus_type.lower() in allowed_types_lower
+            price_ok = min_price <= service.price_in_rs <= max_price
+            time_ok = min_dep_str <= service.departure_time <= max_dep_str
+            type_ok = allowed_types_lower is None or service.bus_type.lower() in allowed_types_lower
 
             if price_ok and time_ok and type_ok:
                 filtered_services.append(service)
             else:
-                log.debug(f"Service {service.trip_code} filtered out: Price OK={price_ok}, Time OK={time_ok}, Type OK={type_ok}") 
+                log.debug("Service %s filtered out: Price OK=%s, Time OK=%s, Type OK=%s", service.trip_code, price_ok, time_ok, type_ok)
 
         except Exception as e:
             log.warning(f"Error filtering service {service.trip_code}: {e}")
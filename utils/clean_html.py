@@ -1,42 +1,48 @@
-from bs4 import BeautifulSoup, Comment
+from lxml import etree, html as lxml_html
+from lxml.html import HtmlElement
 import re
 
+_WHITESPACE_RE = re.compile(r"\s+")
+_INTERTAG_SPACE_RE = re.compile(r">\s+<")
+
+# Comments and whitespace-only text nodes are dropped while parsing, and the id index is skipped
+_PARSER = lxml_html.HTMLParser(remove_comments = True, remove_blank_text = True, collect_ids = False, no_network = True)
+
+_TAGS_TO_REMOVE = (
+    "head", "script", "style", "noscript", "iframe", "img", "link", 
+    "meta", "header", "footer", "nav", "button", "input", "svg"
+)
+# Class names label the fields and data-bus-type holds the bus type; every other attribute is noise to the LLM
+_ATTRIBUTES_TO_KEEP = frozenset(("class", "data-bus-type"))
+_KEEP_WHEN_EMPTY = frozenset(("table", "tr", "td", "th"))
+
 def minify_html(html: str) -> str:
     """
-    Minifies HTML by removing non-essential tags and attributes,
-    but preserves key identifiers like class, id, and data-*.
+    Minifies HTML for an LLM prompt by removing non-essential tags, comments
+    and attributes, keeping only class names and data-bus-type.
+    Parsed and rewritten with lxml, so the tree work stays in C.
+    """
+    if not html.strip():
+        return ""
+    return minify_element(lxml_html.fromstring(html, parser = _PARSER))
+
+def minify_element(root: HtmlElement) -> str:
     """
-    soup = BeautifulSoup(html, "html.parser")
-
-    tags_to_remove = [
-        "head", "script", "style", "noscript", "iframe", "img", "link", 
-        "meta", "header", "footer", "nav", "button", "input"
-    ]
-    for tag in soup.find_all(tags_to_remove):
-        tag.decompose()
-
-    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
-        comment.extract()
-
-    attributes_to_remove = [
-        "style", "onclick", "href", "width", "height", "cellpadding", 
-        "cellspacing", "border", "bgcolor", "background", "align", 
-        "valign", "target", "rel", "type", "role", "aria-labelledby",
-        "aria-hidden", "method", "action", "autocomplete"
-    ]
-    
-    for tag in soup.find_all(True):
-        attrs = tag.attrs.copy()
-        for attr in attrs:
-            if attr not in ["id", "class"] and not attr.startswith("data-"):
-                del tag.attrs[attr]
-
-    for tag in soup.find_all():
-        if not tag.get_text(strip=True) and not tag.find_all(recursive=False):
-             if tag.name not in ["table", "tr", "td", "th"]:
-                tag.decompose()
-
-    compact = str(soup)
-    compact = re.sub(r"\s+", " ", compact)
-    compact = re.sub(r">\s+<", "><", compact)
+    Same as minify_html for an already parsed element, so callers holding an lxml
+    tree skip the serialize / re-parse round trip. Modifies the element in place.
+    """
+    etree.strip_elements(root, *_TAGS_TO_REMOVE, with_tail = False)
+
+    for el in root.iter(etree.Element):
+        for attr in [name for name in el.attrib if name not in _ATTRIBUTES_TO_KEEP]:
+            del el.attrib[attr]
+
+    # Empty leaf elements go in a single document-order pass, so a parent emptied by it is kept
+    for el in list(root.iter(etree.Element)):
+        if el is not root and len(el) == 0 and not (el.text or "").strip() and el.tag not in _KEEP_WHEN_EMPTY:
+            el.drop_tree()
+
+    compact = lxml_html.tostring(root, encoding = "unicode", with_tail = False)
+    compact = _WHITESPACE_RE.sub(" ", compact)
+    compact = _INTERTAG_SPACE_RE.sub("><", compact)
     return compact.strip()
\ No newline at end of file